@@ -2,36 +2,46 @@ from typing import Annotated
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from redis.asyncio import Redis
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
-from app.api.dependencies.mysql import AuthMySQLDep
+from app.api.dependencies.mysql import AuthMySQLSessionMakerDep
 from app.api.dependencies.redis import AuthRedisDep
 from app.core.config import settings
-from app.core.token import Token
+from app.core.scope import Scope
+from app.core.token import Token, TokenCache, JWTPayload
+from app.decorators.cache import fill_ttl
+from app.decorators.singleflight import singleflight
 from app.domains.auth.const import TokenType
 from app.domains.auth.curd import UserCurd
 from app.domains.auth.exception import AuthError
-from app.domains.auth.schema import UserSelect
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_PREFIX}/auth/login")
 
 
-def check_scopes(*scopes: str):
-    async def _checker(
-            token: Annotated[str, Depends(oauth2_scheme)],
-            session: AuthMySQLDep,
-            redis: AuthRedisDep,
-    ):
-        try:
-            payload = await Token.verify(redis, TokenType.ACCESS, token)
-        except Exception:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail=AuthError.INVALID_TOKEN,
-                headers={
-                    "WWW-Authenticate": "Bearer"
-                },
-            )
-        user = await UserCurd.select(session, UserSelect(username=payload["sub"]))
+@singleflight(key=lambda token, session_maker, redis: token)
+async def resolve_token(
+        token: str,
+        session_maker: async_sessionmaker[AsyncSession],
+        redis: Redis,
+) -> tuple[JWTPayload, frozenset[str]]:
+    try:
+        payload = await Token.verify(redis, TokenType.ACCESS, token)
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=AuthError.INVALID_TOKEN,
+            headers={
+                "WWW-Authenticate": "Bearer"
+            },
+        )
+    version = await Scope.version(redis)
+    user_scopes = await Scope.get(redis, payload["sub"], version)
+    if user_scopes is None:
+        # the result is shared by every waiter, so it must not run on any one caller's session
+        async with session_maker() as session:
+            user = await UserCurd.credential(session, payload["sub"])
+            ttl = fill_ttl(session, settings.SCOPE_CACHE_TTL)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -40,8 +50,23 @@ def check_scopes(*scopes: str):
                     "WWW-Authenticate": "Bearer"
                 },
             )
+        user_scopes = await Scope.set(redis, payload["sub"], user.scopes, version, ttl)
+    TokenCache.set(token, payload, user_scopes)
+    return payload, user_scopes
+
+
+def check_scopes(*scopes: str):
+    async def _checker(
+            token: Annotated[str, Depends(oauth2_scheme)],
+            session_maker: AuthMySQLSessionMakerDep,
+            redis: AuthRedisDep,
+    ):
+        if cached := TokenCache.get(token):
+            payload, user_scopes = cached
+        else:
+            payload, user_scopes = await resolve_token(token, session_maker, redis)
+
         jwt_scopes = set(payload["scopes"])
-        user_scopes = set(user.scopes)
 
         if jwt_scopes != user_scopes:
             raise HTTPException(
@@ -59,5 +84,6 @@ def check_scopes(*scopes: str):
                     "WWW-Authenticate": "Bearer"
                 },
             )
+        return user_scopes
 
     return _checker
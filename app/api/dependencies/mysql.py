@@ -1,18 +1,22 @@
+import logging
 from typing import AsyncGenerator, Annotated
 
 from fastapi import Request, HTTPException, status, Depends
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
+from app.core.database.stats import track_connections
 from app.domains.base_exception import Error
 
 
 async def get_auth_mysql(request: Request) -> AsyncGenerator[AsyncSession, None]:
     if session_maker := getattr(request.state, "auth_mysql_session_maker", None):
+        request.state.connection_stats = track_connections()
         async with session_maker() as session:
             try:
                 yield session
             finally:
                 await session.close()
+                logging.debug(f"{request.url.path} connections: {request.state.connection_stats}")
     else:
         raise HTTPException(
             status_code=status.HTTP_424_FAILED_DEPENDENCY,
@@ -20,4 +24,14 @@ async def get_auth_mysql(request: Request) -> AsyncGenerator[AsyncSession, None]
         )
 
 
+async def get_auth_mysql_session_maker(request: Request) -> async_sessionmaker[AsyncSession]:
+    if session_maker := getattr(request.state, "auth_mysql_session_maker", None):
+        return session_maker
+    raise HTTPException(
+        status_code=status.HTTP_424_FAILED_DEPENDENCY,
+        detail=Error.INVALID_MYSQL,
+    )
+
+
 AuthMySQLDep = Annotated[AsyncSession, Depends(get_auth_mysql)]
+AuthMySQLSessionMakerDep = Annotated[async_sessionmaker[AsyncSession], Depends(get_auth_mysql_session_maker)]
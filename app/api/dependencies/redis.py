@@ -3,11 +3,13 @@ from typing import Annotated
 from fastapi import Request, HTTPException, status, Depends
 from redis.asyncio import Redis
 
+from app.core.database.stats import track_connections
 from app.domains.base_exception import Error
 
 
 async def get_auth_redis(request: Request) -> Redis:
     if auth_redis_pool := getattr(request.state, "auth_redis_pool", None):
+        request.state.connection_stats = track_connections()
         return Redis.from_pool(auth_redis_pool)
     raise HTTPException(
         status_code=status.HTTP_424_FAILED_DEPENDENCY,
@@ -1,150 +1,274 @@
-from typing import Annotated
+import io
+from typing import Annotated, Literal
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, UploadFile, Form
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
 
 from app.api.dependencies.auth import check_scopes
-from app.api.dependencies.mysql import AuthMySQLDep
+from app.api.dependencies.mysql import AuthMySQLDep, AuthMySQLSessionMakerDep
 from app.api.dependencies.redis import AuthRedisDep
 from app.domains.auth.schema import *
 from app.domains.auth.service import AuthService
+from app.core.response import FastJSONResponse
 from app.domains.base_schema import BaseResponse
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
 
-@router.post("/login", response_model=BaseResponse, description="login")
+@router.post("/login", response_model=BaseResponse[TokenData], description="login")
 async def login(
         form: Annotated[OAuth2PasswordRequestForm, Depends()],
         session: AuthMySQLDep,
         redis: AuthRedisDep,
         service: AuthService = Depends(AuthService.instance)
-) -> BaseResponse:
+) -> FastJSONResponse:
     return await service.safe_execute(service.login, form, session, redis)
 
 
-@router.post("/refresh-token", response_model=BaseResponse, description="refresh token")
+@router.post("/refresh-token", response_model=BaseResponse[TokenData], description="refresh token")
 async def refresh_token(
         body: RefreshRequestBody,
         redis: AuthRedisDep,
         service: AuthService = Depends(AuthService.instance)
-) -> BaseResponse:
+) -> FastJSONResponse:
     return await service.safe_execute(service.refresh_token, body, redis)
 
 
-@router.post("/logout", response_model=BaseResponse, description="logout")
+@router.post("/logout", response_model=BaseResponse[None], description="logout")
 async def logout(
         body: LogoutRequestBody,
         session: AuthMySQLDep,
         redis: AuthRedisDep,
         service: AuthService = Depends(AuthService.instance)
-) -> BaseResponse:
+) -> FastJSONResponse:
     return await service.safe_execute(service.logout, body, session, redis)
 
 
-@router.post("/user/select", dependencies=[Depends(check_scopes("user:select"))])
+@router.post(
+    "/introspect",
+    response_model=BaseResponse[IntrospectResponse],
+    dependencies=[Depends(check_scopes("token:introspect"))],
+    description="introspect a batch of access tokens",
+)
+async def introspect(
+        body: IntrospectRequestBody,
+        session: AuthMySQLDep,
+        redis: AuthRedisDep,
+        service: AuthService = Depends(AuthService.instance)
+) -> FastJSONResponse:
+    return await service.safe_execute(service.introspect, body, session, redis)
+
+
+@router.post(
+    "/user/select",
+    response_model=BaseResponse[UserPublic],
+    dependencies=[Depends(check_scopes("user:select"))],
+)
 async def select_user(
         body: UserSelect,
         session: AuthMySQLDep,
         service: AuthService = Depends(AuthService.instance)
-) -> BaseResponse:
+) -> FastJSONResponse:
     return await service.safe_execute(service.select_user, session, body)
 
 
-@router.post("/user/create", dependencies=[Depends(check_scopes("user:create"))])
+@router.post("/user/list", response_model=BaseResponse[UserPage], dependencies=[Depends(check_scopes("user:select"))])
+async def list_users(
+        body: UserList,
+        session: AuthMySQLDep,
+        service: AuthService = Depends(AuthService.instance)
+) -> FastJSONResponse:
+    return await service.safe_execute(service.list_users, session, body)
+
+
+@router.post("/user/export", dependencies=[Depends(check_scopes("user:export"))])
+async def export_users(
+        session_maker: AuthMySQLSessionMakerDep,
+        service: AuthService = Depends(AuthService.instance)
+) -> StreamingResponse:
+    return StreamingResponse(service.export_users(session_maker), media_type="application/x-ndjson")
+
+
+@router.post(
+    "/user/import",
+    response_model=BaseResponse[UserImportResult],
+    dependencies=[Depends(check_scopes("user:import"))],
+)
+async def import_users(
+        file: UploadFile,
+        session: AuthMySQLDep,
+        fmt: Annotated[Literal["csv", "ndjson"] | None, Form(alias="format")] = None,
+        upsert: Annotated[bool, Form()] = False,
+        service: AuthService = Depends(AuthService.instance)
+) -> FastJSONResponse:
+    fmt = fmt or ("csv" if (file.filename or "").lower().endswith(".csv") else "ndjson")
+    lines = io.TextIOWrapper(file.file, encoding="utf-8", newline="")
+    return await service.safe_execute(service.import_users, session, lines, fmt, upsert)
+
+
+@router.post(
+    "/user/create",
+    response_model=BaseResponse[UserPublic],
+    dependencies=[Depends(check_scopes("user:create"))],
+)
 async def create_user(
         body: UserCreate,
         session: AuthMySQLDep,
         service: AuthService = Depends(AuthService.instance)
-) -> BaseResponse:
+) -> FastJSONResponse:
     return await service.safe_execute(service.create_user, session, body)
 
 
-@router.post("/user/update", dependencies=[Depends(check_scopes("user:update"))])
+@router.post(
+    "/user/update",
+    response_model=BaseResponse[UserPublic],
+    dependencies=[Depends(check_scopes("user:update"))],
+)
 async def update_user(
         body: UserUpdate,
         session: AuthMySQLDep,
         service: AuthService = Depends(AuthService.instance)
-) -> BaseResponse:
+) -> FastJSONResponse:
     return await service.safe_execute(service.update_user, session, body)
 
 
-@router.post("/user/delete", dependencies=[Depends(check_scopes("user:delete"))])
+@router.post("/user/delete", response_model=BaseResponse[None], dependencies=[Depends(check_scopes("user:delete"))])
 async def delete_user(
         body: UserDelete,
         session: AuthMySQLDep,
         service: AuthService = Depends(AuthService.instance)
-) -> BaseResponse:
+) -> FastJSONResponse:
     return await service.safe_execute(service.delete_user, session, body)
 
 
-@router.post("/role/select", dependencies=[Depends(check_scopes("role:select"))])
+@router.post(
+    "/role/select",
+    response_model=BaseResponse[RolePublic],
+    dependencies=[Depends(check_scopes("role:select"))],
+)
 async def select_role(
         body: RoleSelect,
         session: AuthMySQLDep,
         service: AuthService = Depends(AuthService.instance)
-) -> BaseResponse:
+) -> FastJSONResponse:
     return await service.safe_execute(service.select_role, session, body)
 
 
-@router.post("/role/create", dependencies=[Depends(check_scopes("role:create"))])
+@router.post("/role/list", response_model=BaseResponse[RolePage], dependencies=[Depends(check_scopes("role:select"))])
+async def list_roles(
+        body: RoleList,
+        session: AuthMySQLDep,
+        service: AuthService = Depends(AuthService.instance)
+) -> FastJSONResponse:
+    return await service.safe_execute(service.list_roles, session, body)
+
+
+@router.post(
+    "/role/create",
+    response_model=BaseResponse[RolePublic],
+    dependencies=[Depends(check_scopes("role:create"))],
+)
 async def create_role(
         body: RoleCreate,
         session: AuthMySQLDep,
         service: AuthService = Depends(AuthService.instance)
-) -> BaseResponse:
+) -> FastJSONResponse:
     return await service.safe_execute(service.create_role, session, body)
 
 
-@router.post("/role/update", dependencies=[Depends(check_scopes("role:update"))])
+@router.post(
+    "/role/update",
+    response_model=BaseResponse[RolePublic],
+    dependencies=[Depends(check_scopes("role:update"))],
+)
 async def update_role(
         body: RoleUpdate,
         session: AuthMySQLDep,
         service: AuthService = Depends(AuthService.instance)
-) -> BaseResponse:
+) -> FastJSONResponse:
     return await service.safe_execute(service.update_role, session, body)
 
 
-@router.post("/role/delete", dependencies=[Depends(check_scopes("role:delete"))])
+@router.post("/role/delete", response_model=BaseResponse[None], dependencies=[Depends(check_scopes("role:delete"))])
 async def delete_role(
         body: RoleDelete,
         session: AuthMySQLDep,
         service: AuthService = Depends(AuthService.instance)
-) -> BaseResponse:
+) -> FastJSONResponse:
     return await service.safe_execute(service.delete_role, session, body)
 
 
-@router.post("/permission/select", dependencies=[Depends(check_scopes("permission:select"))])
+@router.post(
+    "/permission/select",
+    response_model=BaseResponse[PermissionPublic],
+    dependencies=[Depends(check_scopes("permission:select"))],
+)
 async def select_permission(
         body: PermissionSelect,
         session: AuthMySQLDep,
         service: AuthService = Depends(AuthService.instance)
-) -> BaseResponse:
+) -> FastJSONResponse:
     return await service.safe_execute(service.select_permission, session, body)
 
 
-@router.post("/permission/create", dependencies=[Depends(check_scopes("permission:create"))])
+@router.post(
+    "/permission/list",
+    response_model=BaseResponse[PermissionPage],
+    dependencies=[Depends(check_scopes("permission:select"))],
+)
+async def list_permissions(
+        body: PermissionList,
+        session: AuthMySQLDep,
+        service: AuthService = Depends(AuthService.instance)
+) -> FastJSONResponse:
+    return await service.safe_execute(service.list_permissions, session, body)
+
+
+@router.post(
+    "/permission/create",
+    response_model=BaseResponse[PermissionPublic],
+    dependencies=[Depends(check_scopes("permission:create"))],
+)
 async def create_permission(
         body: PermissionCreate,
         session: AuthMySQLDep,
         service: AuthService = Depends(AuthService.instance)
-) -> BaseResponse:
+) -> FastJSONResponse:
     return await service.safe_execute(service.create_permission, session, body)
 
 
-@router.post("/permission/update", dependencies=[Depends(check_scopes("permission:update"))])
+@router.post(
+    "/permission/update",
+    response_model=BaseResponse[PermissionPublic],
+    dependencies=[Depends(check_scopes("permission:update"))],
+)
 async def update_permission(
         body: PermissionUpdate,
         session: AuthMySQLDep,
         service: AuthService = Depends(AuthService.instance)
-) -> BaseResponse:
+) -> FastJSONResponse:
     return await service.safe_execute(service.update_permission, session, body)
 
 
-@router.post("/permission/delete", dependencies=[Depends(check_scopes("permission:delete"))])
+@router.post(
+    "/permission/delete",
+    response_model=BaseResponse[None],
+    dependencies=[Depends(check_scopes("permission:delete"))],
+)
 async def delete_permission(
         body: PermissionDelete,
         session: AuthMySQLDep,
         service: AuthService = Depends(AuthService.instance)
-) -> BaseResponse:
+) -> FastJSONResponse:
     return await service.safe_execute(service.delete_permission, session, body)
+
+
+@router.post("/batch", response_model=BaseResponse[BatchResponse])
+async def batch(
+        body: BatchRequestBody,
+        session: AuthMySQLDep,
+        scopes: Annotated[frozenset[str], Depends(check_scopes())],
+        service: AuthService = Depends(AuthService.instance)
+) -> FastJSONResponse:
+    return await service.safe_execute(service.batch, session, body, scopes)
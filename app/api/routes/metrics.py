@@ -0,0 +1,17 @@
+import asyncio
+
+from fastapi import APIRouter, Response
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+
+from app.core.config import settings
+from app.core.metrics import Metrics, registry
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get(settings.METRICS_PATH, include_in_schema=False)
+async def metrics() -> Response:
+    Metrics.collect()
+    # in multiprocess mode this reads one file per worker, so it stays off the event loop
+    body = await asyncio.to_thread(generate_latest, registry())
+    return Response(content=body, media_type=CONTENT_TYPE_LATEST)
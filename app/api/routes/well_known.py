@@ -0,0 +1,18 @@
+from fastapi import APIRouter, Request, Response, status
+
+from app.core.config import settings
+from app.core.jwk import KeySet
+
+router = APIRouter(prefix="/.well-known", tags=["well-known"])
+
+
+@router.get("/jwks.json", description="public keys for verifying access tokens")
+async def jwks(request: Request) -> Response:
+    body, etag = KeySet.jwks()
+    headers = {
+        "Cache-Control": f"public, max-age={settings.JWKS_MAX_AGE}",
+        "ETag": etag,
+    }
+    if request.headers.get("If-None-Match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
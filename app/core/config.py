@@ -1,3 +1,4 @@
+import os
 import secrets
 from typing import Literal, Annotated
 
@@ -25,6 +26,12 @@ class Settings(BaseSettings):
     VERSION: str = "0.0.1"
     CORS_ORIGINS: Annotated[list[AnyUrl] | str, BeforeValidator(parse_to_list)] = []
     API_PREFIX: str = "/api"
+    PAGE_SIZE: int = 50
+    PAGE_SIZE_MAX: int = 1000
+    EXPORT_CHUNK_SIZE: int = 1000
+    IMPORT_BATCH_SIZE: int = 1000
+    BATCH_MAX_OPERATIONS: int = 1000
+    INTROSPECT_MAX_TOKENS: int = 100
 
     @computed_field
     @property
@@ -39,11 +46,72 @@ class Settings(BaseSettings):
     # OAuth
     SECRET_KEY: str = secrets.token_urlsafe(32)
     ALGORITHM: str = "HS256"
+    # ES256 / EdDSA only: the first private key signs, the rest and the public keys still verify during rotation
+    JWT_PRIVATE_KEY_FILES: Annotated[list[str] | str, BeforeValidator(parse_to_list)] = []
+    JWT_PUBLIC_KEY_FILES: Annotated[list[str] | str, BeforeValidator(parse_to_list)] = []
+    JWKS_MAX_AGE: int = 60 * 5
     ISSUER: str = "arc-fastapi"
     AUDIENCE: str = "arc-fastapi"
     LEEWAY: float = 30.0
     ACCESS_TOKEN_EXPIRE_SECONDS: int = 60 * 10
     REFRESH_TOKEN_EXPIRE_SECONDS: int = 60 * 60 * 24 * 7
+    TOKEN_STORE: Literal["key", "zset"] = "key"
+    TOKEN_VERIFY_MODE: Literal["redis", "local"] = "redis"
+    TOKEN_REVOKED_RESYNC_SECONDS: float = 60.0
+    TOKEN_CACHE_SIZE: int = 10000
+    TOKEN_CACHE_MAX_AGE: float = 5.0
+    SCOPE_CACHE_SIZE: int = 10000
+    SCOPE_CACHE_TTL: int = 60 * 60
+    RBAC_VERSION_TTL: float = 1.0
+
+    # Cache
+    CACHE_TTL: int = 60
+    CACHE_SIZE: int = 10000
+    CACHE_REDIS: bool = True
+    CACHE_KEY_PREFIX: str = "auth:cache:"
+
+    # Password
+    PASSWORD_HASH_WORKERS: int = 4
+    PASSWORD_HASH_QUEUE_SIZE: int = 64
+    # hashing processes of each server worker for bulk imports, kept apart from the interactive thread pool
+    PASSWORD_BULK_WORKERS: int = 2
+    # bulk hash batches running at once per server worker, further imports wait for a slot
+    PASSWORD_BULK_CONCURRENCY: int = 1
+
+    # Server
+    SERVER_HOST: str = "0.0.0.0"
+    SERVER_PORT: int = 8000
+    # 0 runs one worker per core
+    SERVER_WORKERS: int = 0
+    # import the app once in the master so workers share its memory copy-on-write
+    SERVER_PRELOAD: bool = True
+    # restart a worker after this many requests, the jitter keeps them from restarting together
+    SERVER_MAX_REQUESTS: int = 10000
+    SERVER_MAX_REQUESTS_JITTER: int = 1000
+    # delay between worker boots so their lifespans do not all hit mysql at once
+    SERVER_STARTUP_STAGGER: float = 0.5
+    SERVER_TIMEOUT: int = 30
+    SERVER_GRACEFUL_TIMEOUT: int = 30
+    SERVER_KEEPALIVE: int = 5
+    SERVER_BACKLOG: int = 2048
+    # share of requests timed per phase (db, redis, jwt, bcrypt, http, serialize), logged and sent as Server-Timing
+    SERVER_TIMING_SAMPLE_RATE: float = 0.01
+    SERVER_TIMING_HEADER: bool = True
+    # level of the per-request timing log line, it has its own handler so it is emitted without logging config
+    SERVER_TIMING_LOG_LEVEL: Literal["DEBUG", "INFO", "WARNING"] = "INFO"
+
+    @computed_field
+    @property
+    def SERVER_WORKER_COUNT(self) -> int:
+        return self.SERVER_WORKERS or os.cpu_count() or 1
+
+    # Metrics
+    METRICS_ENABLED: bool = True
+    METRICS_PATH: str = "/metrics"
+    # how often each worker flushes its pool and cache stats
+    METRICS_INTERVAL: float = 5.0
+    # shared by the gunicorn workers, cleared by app.server on start
+    METRICS_MULTIPROC_DIR: str = "/tmp/fastapi-arch-metrics"
 
     # Aiohttp
     AIOHTTP_TIMEOUT: int = 30
@@ -56,6 +124,11 @@ class Settings(BaseSettings):
     REDIS_DECODE_RESPONSES: bool = True
     REDIS_RETRY_ON_TIMEOUT: bool = True
     REDIS_MAX_CONNECTIONS: int = 10
+    # connections opened before the worker accepts traffic
+    REDIS_PREWARM_CONNECTIONS: int = 2
+    REDIS_CLIENT_CACHE: bool = False
+    REDIS_CLIENT_CACHE_SIZE: int = 100000
+    REDIS_CLIENT_CACHE_TTL: float = 60.0
 
     REDIS_AUTH_DB: int = 0
 
@@ -82,9 +155,19 @@ class Settings(BaseSettings):
     MYSQL_POOL_SIZE: int = 10
     MYSQL_POOL_RECYCLE: int = 1800
     MYSQL_POOL_TIMEOUT: int = 30
+    # connections opened per engine before the worker accepts traffic
+    MYSQL_PREWARM_CONNECTIONS: int = 2
+    # create the schema and seed the admin from the workers, disable when app.scripts.bootstrap runs on deploy
+    MYSQL_BOOTSTRAP: bool = True
 
     MYSQL_AUTH_DB: str = "auth"
 
+    # host or host:port per replica, read-only queries are spread over them
+    MYSQL_REPLICA_HOSTS: Annotated[list[str] | str, BeforeValidator(parse_to_list)] = []
+    MYSQL_REPLICA_STRATEGY: Literal["round_robin", "least_connections"] = "round_robin"
+    # cache entries filled from a replica expire after this many seconds, bounding how long lag can serve revoked grants
+    MYSQL_REPLICA_CACHE_TTL: int = 5
+
     @computed_field
     @property
     def MYSQL_AUTH_DB_URL(self) -> str:
@@ -97,6 +180,22 @@ class Settings(BaseSettings):
             path=self.MYSQL_AUTH_DB,
         ).unicode_string()
 
+    @computed_field
+    @property
+    def MYSQL_AUTH_REPLICA_URLS(self) -> list[str]:
+        urls = []
+        for replica in self.MYSQL_REPLICA_HOSTS:
+            host, _, port = replica.partition(":")
+            urls.append(MultiHostUrl.build(
+                scheme="mysql+aiomysql",
+                username=self.MYSQL_USERNAME,
+                password=self.MYSQL_PASSWORD,
+                host=host,
+                port=int(port) if port else self.MYSQL_PORT,
+                path=self.MYSQL_AUTH_DB,
+            ).unicode_string())
+        return urls
+
     @computed_field
     @property
     def MYSQL_ECHO(self) -> bool:
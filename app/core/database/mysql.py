@@ -1,17 +1,134 @@
+import asyncio
+import hashlib
+import itertools
 import logging
+import time
+from contextlib import AsyncExitStack
+from typing import Sequence
 
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession, async_sessionmaker
+from redis.asyncio import ConnectionPool
+from sqlalchemy import Engine, Select, event, MetaData, Table, Column, Integer, String, select, insert, delete
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession, async_sessionmaker, AsyncConnection
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.schema import CreateTable
 from sqlmodel import SQLModel
 
 from app.core.config import settings
+from app.core.database.stats import record_connection
+from app.core.timing import record
 from app.domains.auth.curd import UserCurd, RoleCurd, PermissionCurd, RolePermissionCurd, UserRoleCurd
 from app.domains.auth.schema import UserCreate, RoleCreate, PermissionCreate, GrantPermission, GrantRole, UserSelect, \
     RoleSelect, PermissionSelect
 
 
-async def create_auth_mysql_engine() -> AsyncEngine:
+# kept out of SQLModel.metadata so it is not part of the schema it fingerprints
+_bootstrap_table = Table(
+    "auth_bootstrap",
+    MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("fingerprint", String(64), nullable=False),
+)
+
+
+class ReplicaRouter:
+    def __init__(self, engines: Sequence[AsyncEngine]):
+        self.engines = [engine.sync_engine for engine in engines]
+        self._cycle = itertools.cycle(self.engines)
+
+    def choose(self) -> Engine:
+        if settings.MYSQL_REPLICA_STRATEGY == "least_connections":
+            return min(self.engines, key=lambda engine: engine.pool.checkedout())
+        return next(self._cycle)
+
+
+class RoutingSession(Session):
+    # reads go to a replica until the session writes, then everything stays on the primary for read-your-writes,
+    # sessions with info["auth_primary"] always use the primary, info["auth_replica_read"] marks a replica read
+
+    def get_bind(self, mapper=None, *, clause=None, **kwargs):
+        router: ReplicaRouter | None = self.info.get("auth_replica_router")
+        if router is None or self.info.get("auth_primary"):
+            return super().get_bind(mapper, clause=clause, **kwargs)
+        if self._flushing or not isinstance(clause, Select):
+            self.info["auth_primary"] = True
+            return super().get_bind(mapper, clause=clause, **kwargs)
+        self.info["auth_replica_read"] = True
+        return router.choose()
+
+
+@event.listens_for(RoutingSession, "after_begin")
+def _checkout(session: Session, transaction, connection) -> None:
+    # AsyncSession only takes a pooled connection on its first statement, one per bind
+    session.info.setdefault("auth_checkouts", []).append(time.perf_counter())
+
+
+@event.listens_for(RoutingSession, "after_transaction_end")
+def _release(session: Session, transaction) -> None:
+    if transaction.parent is None:
+        for checked_out_at in session.info.pop("auth_checkouts", ()):
+            record_connection("mysql", checked_out_at)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_execute(connection, cursor, statement, parameters, context, executemany) -> None:
+    # the execution context lives for exactly one statement, so the start never leaks into the next one
+    context.auth_query_started = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_execute(connection, cursor, statement, parameters, context, executemany) -> None:
+    record("db", time.perf_counter() - context.auth_query_started)
+
+
+@event.listens_for(Engine, "handle_error")
+def _execute_error(context) -> None:
+    if (started := getattr(context.execution_context, "auth_query_started", None)) is not None:
+        record("db", time.perf_counter() - started)
+
+
+class TrackedQueuePool(AsyncAdaptedQueuePool):
+    # counts checkouts and the time spent waiting for a free slot (or connecting), read by the metrics collector
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.checkout_seconds = 0.0
+        self.timeouts = 0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            self.checkouts += 1
+            self.checkout_seconds += time.perf_counter() - started
+
+    def recreate(self) -> "TrackedQueuePool":
+        pool = super().recreate()
+        pool.checkouts, pool.checkout_seconds, pool.timeouts = self.checkouts, self.checkout_seconds, self.timeouts
+        return pool
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "size": self.size(),
+            "capacity": self.size() + self._max_overflow,
+            "checked_out": self.checkedout(),
+            "idle": self.checkedin(),
+            "overflow": max(self.overflow(), 0),
+            "checkouts": self.checkouts,
+            "checkout_seconds": self.checkout_seconds,
+            "timeouts": self.timeouts,
+        }
+
+
+async def create_auth_mysql_engine(url: str | None = None) -> AsyncEngine:
     return create_async_engine(
-        settings.MYSQL_AUTH_DB_URL,
+        url or settings.MYSQL_AUTH_DB_URL,
         echo=settings.MYSQL_ECHO,
         echo_pool=settings.MYSQL_ECHO,
         isolation_level=settings.MYSQL_ISOLATION_LEVEL,
@@ -20,18 +137,34 @@ async def create_auth_mysql_engine() -> AsyncEngine:
         pool_size=settings.MYSQL_POOL_SIZE,
         pool_recycle=settings.MYSQL_POOL_RECYCLE,
         pool_timeout=settings.MYSQL_POOL_TIMEOUT,
+        poolclass=TrackedQueuePool,
     )
 
 
-async def create_auth_mysql_session_maker(engine: AsyncEngine) -> async_sessionmaker[AsyncSession]:
-    async with engine.begin() as connection:
-        await connection.run_sync(SQLModel.metadata.create_all)
-    return async_sessionmaker(
+async def create_auth_mysql_replica_engines() -> list[AsyncEngine]:
+    return [await create_auth_mysql_engine(url) for url in settings.MYSQL_AUTH_REPLICA_URLS]
+
+
+async def create_auth_mysql_session_maker(
+        engine: AsyncEngine,
+        auth_redis_pool: ConnectionPool | None = None,
+        replica_engines: Sequence[AsyncEngine] = (),
+) -> async_sessionmaker[AsyncSession]:
+    info = {
+        "auth_redis_pool": auth_redis_pool,
+        "auth_replica_router": ReplicaRouter(replica_engines) if replica_engines else None,
+    }
+    session_maker = async_sessionmaker(
         bind=engine,
         class_=AsyncSession,
+        sync_session_class=RoutingSession,
         autoflush=False,
         expire_on_commit=False,
+        info=info,
     )
+    # work shared between requests runs on a session of its own, see Curd.select and @cached
+    info["auth_session_maker"] = session_maker
+    return session_maker
 
 
 async def init_auth_mysql(session: AsyncSession) -> None:
@@ -59,10 +192,12 @@ async def init_auth_mysql(session: AsyncSession) -> None:
         )
         permission = await PermissionCurd.create(session, permission_in)
 
+    # a failed grant rolls back and expires the rows, so their ids are read first
+    uid, rid, pid = user.id, role.id, permission.id
     try:
         role_permission_in = GrantPermission(
-            rid=role.id,
-            pid=permission.id,
+            rid=rid,
+            pid=pid,
         )
         await RolePermissionCurd.create(session, role_permission_in)
     except Exception as e:
@@ -70,9 +205,58 @@ async def init_auth_mysql(session: AsyncSession) -> None:
 
     try:
         user_role_in = GrantRole(
-            uid=user.id,
-            rid=role.id,
+            uid=uid,
+            rid=rid,
         )
         await UserRoleCurd.create(session, user_role_in)
     except Exception as e:
         logging.warning(e)
+
+
+async def prewarm_auth_mysql(engine: AsyncEngine, count: int = settings.MYSQL_PREWARM_CONNECTIONS) -> None:
+    # connections are held together so the pool really opens that many instead of reusing one
+    async with AsyncExitStack() as stack:
+        await asyncio.gather(*(
+            stack.enter_async_context(engine.connect())
+            for _ in range(min(count, settings.MYSQL_POOL_SIZE))
+        ))
+
+
+def schema_fingerprint(engine: AsyncEngine) -> str:
+    ddl = [str(CreateTable(table).compile(dialect=engine.dialect)) for table in SQLModel.metadata.sorted_tables]
+    seed = [
+        settings.ADMIN_USER_USERNAME,
+        settings.ADMIN_ROLE_NAME,
+        settings.ADMIN_PERMISSION_NAME,
+        settings.ADMIN_PERMISSION_SCOPE,
+    ]
+    return hashlib.sha256("\n".join([*ddl, *seed]).encode()).hexdigest()
+
+
+async def _stored_fingerprint(connection: AsyncConnection) -> str | None:
+    try:
+        return await connection.scalar(select(_bootstrap_table.c.fingerprint))
+    except DBAPIError:
+        # the table does not exist before the first bootstrap
+        await connection.rollback()
+        return None
+
+
+async def bootstrap_auth_mysql(
+        engine: AsyncEngine,
+        session_maker: async_sessionmaker[AsyncSession],
+        force: bool = False,
+) -> bool:
+    fingerprint = schema_fingerprint(engine)
+    async with engine.connect() as connection:
+        if not force and await _stored_fingerprint(connection) == fingerprint:
+            return False
+    async with engine.begin() as connection:
+        await connection.run_sync(SQLModel.metadata.create_all)
+        await connection.run_sync(_bootstrap_table.create, checkfirst=True)
+    async with session_maker() as session:
+        await init_auth_mysql(session)
+    async with engine.begin() as connection:
+        await connection.execute(delete(_bootstrap_table))
+        await connection.execute(insert(_bootstrap_table).values(id=1, fingerprint=fingerprint))
+    return True
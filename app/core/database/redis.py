@@ -1,12 +1,197 @@
-from redis.asyncio import ConnectionPool
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Sequence, TypeVar
+
+from redis.asyncio import ConnectionPool, Redis
+from redis.commands.core import AsyncScript
+from redis.exceptions import ConnectionError
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import settings
+from app.core.database.stats import record_connection
+from app.core.timing import record
+from app.utils.cache import LRUCache
+from app.utils.parse import parse_bytes_to_str
+
+T = TypeVar("T")
+
+_scripts: list[AsyncScript] = []
+
+
+def register_script(source: str) -> AsyncScript:
+    script = AsyncScript(None, source.encode())  # type: ignore[arg-type]
+    _scripts.append(script)
+    return script
+
+
+async def load_scripts(redis: Redis) -> None:
+    for script in _scripts:
+        script.sha = await redis.script_load(script.script)
+
+
+class TrackedConnectionPool(ConnectionPool):
+    # Redis.from_pool checks a connection out per command or pipeline, so its hold time is the command time
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._checked_out_at: dict[int, float] = {}
+        self.checkouts = 0
+        self.exhausted = 0
+
+    async def get_connection(self, command_name=None, *keys, **options):
+        try:
+            connection = await super().get_connection(command_name, *keys, **options)
+        except ConnectionError:
+            # the asyncio pool raises a plain ConnectionError when max_connections are all in use
+            if len(self._in_use_connections) >= self.max_connections:
+                self.exhausted += 1
+            raise
+        self.checkouts += 1
+        self._checked_out_at[id(connection)] = time.perf_counter()
+        return connection
+
+    async def release(self, connection) -> None:
+        if (checked_out_at := self._checked_out_at.pop(id(connection), None)) is not None:
+            record_connection("redis", checked_out_at)
+            record("redis", time.perf_counter() - checked_out_at)
+        await super().release(connection)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "max_connections": self.max_connections,
+            "in_use": len(self._in_use_connections),
+            "idle": len(self._available_connections),
+            "checkouts": self.checkouts,
+            "exhausted": self.exhausted,
+        }
 
 
 async def create_auth_redis_pool() -> ConnectionPool:
-    return ConnectionPool.from_url(
+    return TrackedConnectionPool.from_url(
         url=settings.AUTH_REDIS_DB_URL,
         decode_responses=settings.REDIS_DECODE_RESPONSES,
         retry_on_timeout=settings.REDIS_RETRY_ON_TIMEOUT,
         max_connections=settings.REDIS_MAX_CONNECTIONS,
     )
+
+
+async def prewarm_auth_redis(pool: ConnectionPool, count: int = settings.REDIS_PREWARM_CONNECTIONS) -> None:
+    connections = await asyncio.gather(*(
+        pool.get_connection() for _ in range(min(count, settings.REDIS_MAX_CONNECTIONS))
+    ))
+    for connection in connections:
+        await pool.release(connection)
+
+
+def get_session_redis(session: AsyncSession) -> Redis | None:
+    if auth_redis_pool := session.info.get("auth_redis_pool"):
+        return Redis.from_pool(auth_redis_pool)
+    return None
+
+
+class ClientCache:
+    # values of tracked keys kept per process, Redis broadcasts an invalidation whenever a tracked prefix changes
+    _entries: LRUCache[str, dict[tuple, Any]] = LRUCache(settings.REDIS_CLIENT_CACHE_SIZE)
+    # bumped on every invalidation and on activation, a read that raced either is returned but not cached
+    _epoch: int = 0
+    _active: bool = False
+    _task: asyncio.Task | None = None
+    _hits: int = 0
+    _misses: int = 0
+    _invalidations: int = 0
+    ping_interval: float = 10.0
+
+    @classmethod
+    async def get(cls, key: str, op: tuple, fetch: Callable[[], Awaitable[T]]) -> T:
+        if cls._active:
+            entry = cls._entries.get(key)
+            if entry is not None and op in entry:
+                cls._hits += 1
+                return entry[op]
+            cls._misses += 1
+        epoch = cls._epoch
+        value = await fetch()
+        if cls._active and cls._epoch == epoch:
+            entry = cls._entries.get(key)
+            if entry is None:
+                cls._entries.set(key, {op: value}, settings.REDIS_CLIENT_CACHE_TTL)
+            else:
+                entry[op] = value
+        return value
+
+    @classmethod
+    def invalidate(cls, keys: Sequence[str | bytes] | None) -> None:
+        cls._epoch += 1
+        if keys is None:
+            cls._entries.clear()
+            return
+        for key in keys:
+            cls._entries.pop(parse_bytes_to_str(key))
+        cls._invalidations += len(keys)
+
+    @classmethod
+    async def _track(cls, auth_redis_pool: ConnectionPool, prefixes: Sequence[str]) -> None:
+        # asyncio redis-py drops RESP3 invalidation pushes, so use RESP2 redirection to __redis__:invalidate
+        kwargs = auth_redis_pool.connection_kwargs | {"protocol": 2}
+        while True:
+            listener = auth_redis_pool.connection_class(**kwargs)
+            tracker = auth_redis_pool.connection_class(**kwargs)
+            try:
+                await listener.connect()
+                await listener.send_command("CLIENT", "ID")
+                client_id = await listener.read_response()
+                await listener.send_command("SUBSCRIBE", "__redis__:invalidate")
+                await listener.read_response()
+                await tracker.connect()
+                await tracker.send_command(
+                    "CLIENT", "TRACKING", "ON", "REDIRECT", client_id, "BCAST",
+                    *(arg for prefix in prefixes for arg in ("PREFIX", prefix)),
+                )
+                await tracker.read_response()
+                # a read that started before tracking was on could have missed a write with no invalidation to follow
+                cls._epoch += 1
+                cls._active = True
+                while True:
+                    message = await listener.read_response(timeout=cls.ping_interval)
+                    if message is None:
+                        await tracker.send_command("PING")
+                        await tracker.read_response()
+                        await listener.send_command("PING")
+                        continue
+                    if parse_bytes_to_str(message[0]) == "message":
+                        cls.invalidate(message[2])
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logging.exception("Redis client cache tracking failed, reconnecting.")
+                await asyncio.sleep(1)
+            finally:
+                cls._active = False
+                cls.invalidate(None)
+                await listener.disconnect()
+                await tracker.disconnect()
+
+    @classmethod
+    def start(cls, auth_redis_pool: ConnectionPool, prefixes: Sequence[str]) -> None:
+        if cls._task is None:
+            cls._task = asyncio.create_task(cls._track(auth_redis_pool, prefixes))
+
+    @classmethod
+    async def stop(cls) -> None:
+        if cls._task is not None:
+            cls._task.cancel()
+            try:
+                await cls._task
+            except asyncio.CancelledError:
+                pass
+            cls._task = None
+
+    @classmethod
+    def stats(cls) -> dict[str, int]:
+        return cls._entries.stats() | {
+            "hits": cls._hits,
+            "misses": cls._misses,
+            "invalidations": cls._invalidations,
+            "active": int(cls._active),
+        }
@@ -0,0 +1,28 @@
+import time
+from contextvars import ContextVar
+from typing import TypedDict, Literal
+
+
+class ConnectionStats(TypedDict):
+    mysql_checkouts: int
+    mysql_held: float
+    redis_checkouts: int
+    redis_held: float
+
+
+_stats: ContextVar[ConnectionStats | None] = ContextVar("connection_stats", default=None)
+
+
+def track_connections() -> ConnectionStats:
+    stats = _stats.get()
+    if stats is None:
+        stats = ConnectionStats(mysql_checkouts=0, mysql_held=0.0, redis_checkouts=0, redis_held=0.0)
+        _stats.set(stats)
+    return stats
+
+
+def record_connection(kind: Literal["mysql", "redis"], checked_out_at: float) -> None:
+    if (stats := _stats.get()) is None:
+        return
+    stats[f"{kind}_checkouts"] += 1
+    stats[f"{kind}_held"] += time.perf_counter() - checked_out_at
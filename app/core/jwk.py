@@ -0,0 +1,93 @@
+import base64
+import hashlib
+import json
+from pathlib import Path
+from typing import Any
+
+import jwt
+from cryptography.hazmat.primitives.serialization import load_pem_private_key, load_pem_public_key
+from jwt.algorithms import ECAlgorithm, OKPAlgorithm
+from jwt.exceptions import InvalidTokenError
+
+from app.core.config import settings
+
+# RFC 7638 required members per key type, in lexicographic order
+_THUMBPRINT_MEMBERS = {
+    "EC": ("crv", "kty", "x", "y"),
+    "OKP": ("crv", "kty", "x"),
+}
+
+
+def _to_jwk(key: Any) -> dict[str, str]:
+    if settings.ALGORITHM == "EdDSA":
+        return OKPAlgorithm.to_jwk(key, as_dict=True)
+    return ECAlgorithm.to_jwk(key, as_dict=True)
+
+
+def _thumbprint(jwk: dict[str, str]) -> str:
+    members = {name: jwk[name] for name in _THUMBPRINT_MEMBERS[jwk["kty"]]}
+    raw = json.dumps(members, separators=(",", ":"), sort_keys=True).encode()
+    return base64.urlsafe_b64encode(hashlib.sha256(raw).digest()).rstrip(b"=").decode()
+
+
+class KeySet:
+    # the first private key signs, every other key only verifies until it is rotated out
+    _signing: tuple[str, Any] | None = None
+    _verifying: dict[str, Any] = {}
+    _jwks: bytes = b""
+    _etag: str = ""
+
+    @staticmethod
+    def asymmetric() -> bool:
+        return settings.ALGORITHM in ("ES256", "EdDSA")
+
+    @classmethod
+    def load(cls) -> None:
+        signing = None
+        verifying: dict[str, Any] = {}
+        keys: list[dict[str, str]] = []
+        public_keys = []
+        for path in settings.JWT_PRIVATE_KEY_FILES:
+            private_key = load_pem_private_key(Path(path).read_bytes(), password=None)
+            public_keys.append(private_key.public_key())
+            if signing is None:
+                signing = private_key
+        for path in settings.JWT_PUBLIC_KEY_FILES:
+            public_keys.append(load_pem_public_key(Path(path).read_bytes()))
+        for public_key in public_keys:
+            jwk = _to_jwk(public_key)
+            kid = _thumbprint(jwk)
+            if kid in verifying:
+                continue
+            verifying[kid] = public_key
+            keys.append(jwk | {"kid": kid, "use": "sig", "alg": settings.ALGORITHM})
+        if cls.asymmetric() and signing is None:
+            raise Exception(f"JWT_PRIVATE_KEY_FILES is required for {settings.ALGORITHM}")
+        cls._signing = (keys[0]["kid"], signing) if signing is not None else None
+        cls._verifying = verifying
+        cls._jwks = json.dumps({"keys": keys}, separators=(",", ":")).encode()
+        cls._etag = f'"{hashlib.sha256(cls._jwks).hexdigest()[:32]}"'
+
+    @classmethod
+    def _loaded(cls) -> None:
+        if not cls._etag:
+            cls.load()
+
+    @classmethod
+    def encode(cls, payload: dict) -> str:
+        cls._loaded()
+        kid, key = cls._signing
+        return jwt.encode(payload, key, algorithm=settings.ALGORITHM, headers={"kid": kid})
+
+    @classmethod
+    def key(cls, token: str) -> Any:
+        cls._loaded()
+        kid = jwt.get_unverified_header(token).get("kid")
+        if kid not in cls._verifying:
+            raise InvalidTokenError()
+        return cls._verifying[kid]
+
+    @classmethod
+    def jwks(cls) -> tuple[bytes, str]:
+        cls._loaded()
+        return cls._jwks, cls._etag
@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import os
+from typing import Callable
+
+from aiohttp import TCPConnector
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, multiprocess
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.core.config import settings
+from app.core.database.redis import TrackedConnectionPool
+
+# stats() keys that only ever grow, flushed as counter deltas; every other key is a point-in-time gauge
+_COUNTER_KEYS = {
+    "hits", "misses", "evictions", "invalidations", "completed", "rejected", "leaders", "followers",
+    "checkouts", "checkout_seconds", "timeouts", "exhausted",
+}
+
+# pool gauges sum over live workers, a dead worker's values drop out once gunicorn marks it dead
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "request latency by route template",
+    ["method", "route"],
+)
+REQUESTS = Counter(
+    "http_requests",
+    "requests by route template and status code",
+    ["method", "route", "status_code"],
+)
+MYSQL_POOL = Gauge(
+    "auth_mysql_pool",
+    "mysql pool connections by state",
+    ["engine", "state"],
+    multiprocess_mode="livesum",
+)
+MYSQL_POOL_EVENTS = Counter(
+    "auth_mysql_pool_events",
+    "mysql pool checkouts, seconds spent acquiring and MYSQL_POOL_TIMEOUT expiries",
+    ["engine", "event"],
+)
+REDIS_POOL = Gauge(
+    "auth_redis_pool",
+    "redis pool connections by state",
+    ["state"],
+    multiprocess_mode="livesum",
+)
+REDIS_POOL_EVENTS = Counter(
+    "auth_redis_pool_events",
+    "redis pool checkouts and checkouts refused at REDIS_MAX_CONNECTIONS",
+    ["event"],
+)
+AIOHTTP_CONNECTOR = Gauge(
+    "aiohttp_connector",
+    "aiohttp connector connections by state",
+    ["state"],
+    multiprocess_mode="livesum",
+)
+# per worker, since values such as the scope version do not add up across workers
+COMPONENT = Gauge(
+    "auth_component",
+    "in-process cache, hasher and singleflight state",
+    ["component", "key"],
+    multiprocess_mode="liveall",
+)
+COMPONENT_EVENTS = Counter(
+    "auth_component_events",
+    "in-process cache, hasher and singleflight events",
+    ["component", "event"],
+)
+
+
+def registry() -> CollectorRegistry:
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+    # a fresh registry per scrape reads the values every worker has written to the shared directory
+    collector_registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(collector_registry)
+    return collector_registry
+
+
+class Metrics:
+    # components keep plain in-process counters, they reach prometheus as deltas on every flush
+    _engines: dict[str, AsyncEngine] = {}
+    _redis_pool: TrackedConnectionPool | None = None
+    _connector: TCPConnector | None = None
+    _components: dict[str, Callable[[], dict[str, float]]] = {}
+    _last: dict[tuple, float] = {}
+    _task: asyncio.Task | None = None
+
+    @classmethod
+    def _inc(cls, counter: Counter, labels: tuple[str, ...], value: float) -> None:
+        last = cls._last.get((counter, labels), 0)
+        # a counter that went backwards was reset, everything since is new
+        delta = value - last if value >= last else value
+        if delta:
+            counter.labels(*labels).inc(delta)
+        cls._last[(counter, labels)] = value
+
+    @classmethod
+    def _flush(cls, gauge: Gauge, counter: Counter, labels: tuple[str, ...], stats: dict[str, float]) -> None:
+        for key, value in stats.items():
+            if key in _COUNTER_KEYS:
+                cls._inc(counter, (*labels, key), value)
+            else:
+                gauge.labels(*labels, key).set(value)
+
+    @classmethod
+    def collect(cls) -> None:
+        for name, engine in cls._engines.items():
+            cls._flush(MYSQL_POOL, MYSQL_POOL_EVENTS, (name,), engine.pool.stats())
+        if cls._redis_pool is not None:
+            cls._flush(REDIS_POOL, REDIS_POOL_EVENTS, (), cls._redis_pool.stats())
+        if cls._connector is not None:
+            # the connector has no public counters, these are the sets it tracks connections in
+            AIOHTTP_CONNECTOR.labels("limit").set(cls._connector.limit)
+            AIOHTTP_CONNECTOR.labels("in_use").set(len(cls._connector._acquired))
+            AIOHTTP_CONNECTOR.labels("idle").set(sum(len(conns) for conns in cls._connector._conns.values()))
+        for name, stats in cls._components.items():
+            cls._flush(COMPONENT, COMPONENT_EVENTS, (name,), stats())
+
+    @classmethod
+    async def _run(cls) -> None:
+        while True:
+            await asyncio.sleep(settings.METRICS_INTERVAL)
+            try:
+                cls.collect()
+            except Exception:
+                logging.exception("Metrics collection failed.")
+
+    @classmethod
+    def start(
+            cls,
+            engines: dict[str, AsyncEngine],
+            redis_pool: TrackedConnectionPool,
+            connector: TCPConnector,
+            components: dict[str, Callable[[], dict[str, float]]],
+    ) -> None:
+        cls._engines = engines
+        cls._redis_pool = redis_pool
+        cls._connector = connector
+        cls._components = components
+        if cls._task is None:
+            cls._task = asyncio.create_task(cls._run())
+
+    @classmethod
+    async def stop(cls) -> None:
+        if cls._task is not None:
+            cls._task.cancel()
+            try:
+                await cls._task
+            except asyncio.CancelledError:
+                pass
+            cls._task = None
+        cls.collect()
@@ -0,0 +1,121 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Callable, TypeVar
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from app.core.config import settings
+from app.core.timing import timed
+from app.domains.base_exception import Error
+
+T = TypeVar("T")
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+def _hash_all(passwords: list[str]) -> list[str]:
+    return [pwd_context.hash(password) for password in passwords]
+
+
+class Password:
+    # bcrypt releases the GIL, so a thread pool hashes in parallel without blocking the event loop
+    _executor: ThreadPoolExecutor | None = None
+    # bulk imports get their own process pool so they never queue behind or ahead of logins
+    _bulk_executor: ProcessPoolExecutor | None = None
+    _bulk_semaphore: asyncio.Semaphore | None = None
+    _pending: int = 0
+    _completed: int = 0
+    _rejected: int = 0
+
+    @classmethod
+    def executor(cls) -> ThreadPoolExecutor:
+        if cls._executor is None:
+            cls._executor = ThreadPoolExecutor(
+                max_workers=settings.PASSWORD_HASH_WORKERS,
+                thread_name_prefix="password",
+            )
+        return cls._executor
+
+    @classmethod
+    def bulk_executor(cls) -> ProcessPoolExecutor:
+        if cls._bulk_executor is None:
+            # forking a process that already runs threads can copy a held lock into the child, forkserver starts clean
+            cls._bulk_executor = ProcessPoolExecutor(
+                max_workers=settings.PASSWORD_BULK_WORKERS,
+                mp_context=multiprocessing.get_context("forkserver"),
+            )
+        return cls._bulk_executor
+
+    @classmethod
+    def bulk_semaphore(cls) -> asyncio.Semaphore:
+        if cls._bulk_semaphore is None:
+            cls._bulk_semaphore = asyncio.Semaphore(settings.PASSWORD_BULK_CONCURRENCY)
+        return cls._bulk_semaphore
+
+    @classmethod
+    def stats(cls) -> dict[str, int]:
+        return {
+            "workers": settings.PASSWORD_HASH_WORKERS,
+            "in_flight": min(cls._pending, settings.PASSWORD_HASH_WORKERS),
+            "queued": max(cls._pending - settings.PASSWORD_HASH_WORKERS, 0),
+            "completed": cls._completed,
+            "rejected": cls._rejected,
+        }
+
+    @classmethod
+    async def _run(cls, func: Callable[..., T], *args) -> T:
+        if cls._pending >= settings.PASSWORD_HASH_WORKERS + settings.PASSWORD_HASH_QUEUE_SIZE:
+            cls._rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=Error.BUSY_PASSWORD_HASHER,
+                headers={
+                    "Retry-After": "1"
+                },
+            )
+        cls._pending += 1
+        try:
+            with timed("bcrypt"):
+                result = await asyncio.get_running_loop().run_in_executor(cls.executor(), func, *args)
+        finally:
+            cls._pending -= 1
+        cls._completed += 1
+        return result
+
+    @classmethod
+    async def hash(cls, password: str) -> str:
+        return await cls._run(pwd_context.hash, password)
+
+    @classmethod
+    async def verify(cls, password: str, hashed: str) -> bool:
+        return await cls._run(pwd_context.verify, password, hashed)
+
+    @classmethod
+    async def hash_many(cls, passwords: list[str]) -> list[str]:
+        if not passwords:
+            return []
+        size = -(-len(passwords) // settings.PASSWORD_BULK_WORKERS)
+        loop = asyncio.get_running_loop()
+        async with cls.bulk_semaphore():
+            with timed("bcrypt"):
+                chunks = await asyncio.gather(*(
+                    loop.run_in_executor(cls.bulk_executor(), _hash_all, passwords[i:i + size])
+                    for i in range(0, len(passwords), size)
+                ))
+        return [hashed for chunk in chunks for hashed in chunk]
+
+    @staticmethod
+    def identify(hashed: str) -> str | None:
+        return pwd_context.identify(hashed, required=False)
+
+    @classmethod
+    def shutdown(cls) -> None:
+        if cls._executor is not None:
+            cls._executor.shutdown(wait=False, cancel_futures=True)
+            cls._executor = None
+        if cls._bulk_executor is not None:
+            cls._bulk_executor.shutdown(wait=False, cancel_futures=True)
+            cls._bulk_executor = None
+        cls._bulk_semaphore = None
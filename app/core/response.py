@@ -0,0 +1,17 @@
+from typing import Any
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from pydantic_core import to_json
+
+from app.core.timing import timed
+
+
+class FastJSONResponse(JSONResponse):
+    # models are dumped by their compiled serializer straight to bytes, without a dict or the stdlib json pass
+
+    def render(self, content: Any) -> bytes:
+        with timed("serialize"):
+            if isinstance(content, BaseModel):
+                return content.__pydantic_serializer__.to_json(content)
+            return to_json(content)
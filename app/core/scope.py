@@ -0,0 +1,100 @@
+import json
+import time
+from typing import Iterable
+
+from redis.asyncio import Redis
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database.redis import get_session_redis, ClientCache
+from app.core.token import TokenCache
+from app.domains.auth.const import RedisKey
+from app.utils.cache import LRUCache
+
+
+class Scope:
+    _version: int = 0
+    _version_expire: float = 0.0
+    _local: LRUCache[tuple[int, str], frozenset[str]] = LRUCache(settings.SCOPE_CACHE_SIZE)
+
+    @classmethod
+    async def version(cls, redis: Redis) -> int:
+        if cls._version_expire > time.monotonic():
+            return cls._version
+        cls._version = int(await redis.get(RedisKey.RBAC_VERSION()) or 0)
+        cls._version_expire = time.monotonic() + settings.RBAC_VERSION_TTL
+        return cls._version
+
+    @classmethod
+    async def get(cls, redis: Redis, subject: str, version: int) -> frozenset[str] | None:
+        if (scopes := cls._local.get((version, subject))) is not None:
+            return scopes
+        scopes_key = RedisKey.SCOPES(version, subject)
+        value = await ClientCache.get(scopes_key, ("GET",), lambda: redis.get(scopes_key))
+        if value is None:
+            return None
+        scopes = frozenset(json.loads(value))
+        cls._local.set((version, subject), scopes, settings.SCOPE_CACHE_TTL)
+        return scopes
+
+    @classmethod
+    async def set(
+            cls,
+            redis: Redis,
+            subject: str,
+            scopes: Iterable[str],
+            version: int,
+            ttl: int = settings.SCOPE_CACHE_TTL,
+    ) -> frozenset[str]:
+        scopes = frozenset(scopes)
+        cls._local.set((version, subject), scopes, ttl)
+        await redis.set(RedisKey.SCOPES(version, subject), json.dumps(sorted(scopes)), ex=ttl)
+        return scopes
+
+    @classmethod
+    async def get_many(cls, redis: Redis, subjects: Iterable[str], version: int) -> dict[str, frozenset[str]]:
+        found, missing = {}, []
+        for subject in subjects:
+            if (scopes := cls._local.get((version, subject))) is not None:
+                found[subject] = scopes
+            else:
+                missing.append(subject)
+        if missing:
+            values = await redis.mget([RedisKey.SCOPES(version, subject) for subject in missing])
+            for subject, value in zip(missing, values):
+                if value is not None:
+                    found[subject] = frozenset(json.loads(value))
+                    cls._local.set((version, subject), found[subject], settings.SCOPE_CACHE_TTL)
+        return found
+
+    @classmethod
+    async def set_many(
+            cls,
+            redis: Redis,
+            scopes: dict[str, Iterable[str]],
+            version: int,
+            ttl: int = settings.SCOPE_CACHE_TTL,
+    ) -> dict[str, frozenset[str]]:
+        found = {subject: frozenset(values) for subject, values in scopes.items()}
+        async with redis.pipeline(transaction=False) as pipeline:
+            for subject, values in found.items():
+                cls._local.set((version, subject), values, ttl)
+                pipeline.set(RedisKey.SCOPES(version, subject), json.dumps(sorted(values)), ex=ttl)
+            await pipeline.execute()
+        return found
+
+    @classmethod
+    async def bump(cls, redis: Redis) -> int:
+        cls._version = await redis.incr(RedisKey.RBAC_VERSION())
+        cls._version_expire = time.monotonic() + settings.RBAC_VERSION_TTL
+        TokenCache.clear()
+        return cls._version
+
+    @classmethod
+    async def invalidate(cls, session: AsyncSession) -> None:
+        if redis := get_session_redis(session):
+            await cls.bump(redis)
+
+    @classmethod
+    def stats(cls) -> dict[str, int]:
+        return cls._local.stats() | {"version": cls._version}
@@ -0,0 +1,60 @@
+import time
+from contextvars import ContextVar, Token
+from types import SimpleNamespace
+
+from aiohttp import ClientSession, TraceConfig, TraceRequestStartParams, TraceRequestEndParams
+
+# phase -> [seconds, calls] of the current sampled request, None when the request is not sampled
+_phases: ContextVar[dict[str, list] | None] = ContextVar("phases", default=None)
+
+
+def start_timing() -> tuple[dict[str, list], Token]:
+    phases: dict[str, list] = {}
+    return phases, _phases.set(phases)
+
+
+def stop_timing(token: Token) -> None:
+    _phases.reset(token)
+
+
+def record(phase: str, seconds: float) -> None:
+    if (phases := _phases.get()) is None:
+        return
+    if (entry := phases.get(phase)) is None:
+        phases[phase] = [seconds, 1]
+    else:
+        entry[0] += seconds
+        entry[1] += 1
+
+
+class _Timed:
+    __slots__ = ("phase", "started")
+
+    def __init__(self, phase: str):
+        self.phase = phase
+
+    def __enter__(self) -> None:
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info) -> None:
+        record(self.phase, time.perf_counter() - self.started)
+
+
+def timed(phase: str) -> _Timed:
+    return _Timed(phase)
+
+
+async def _on_request_start(session: ClientSession, context: SimpleNamespace, params: TraceRequestStartParams) -> None:
+    context.started = time.perf_counter()
+
+
+async def _on_request_end(session: ClientSession, context: SimpleNamespace, params: TraceRequestEndParams) -> None:
+    record("http", time.perf_counter() - context.started)
+
+
+def trace_config() -> TraceConfig:
+    config = TraceConfig()
+    config.on_request_start.append(_on_request_start)
+    config.on_request_end.append(_on_request_end)
+    config.on_request_exception.append(_on_request_end)  # type: ignore[arg-type]
+    return config
@@ -1,14 +1,22 @@
 import asyncio
+import json
+import logging
+import time
 import uuid
 from datetime import datetime, timedelta, timezone
-from typing import TypedDict
+from typing import TypedDict, NamedTuple
 
 import jwt
 from jwt.exceptions import InvalidTokenError
-from redis.asyncio import Redis
+from redis.asyncio import Redis, ConnectionPool
 
 from app.core.config import settings
+from app.core.database.redis import register_script, ClientCache
+from app.core.jwk import KeySet
+from app.core.timing import timed
 from app.domains.auth.const import TokenType, RedisKey
+from app.utils.cache import LRUCache
+from app.utils.parse import parse_bytes_to_str
 
 
 class JWTPayload(TypedDict, total=False):
@@ -23,6 +31,111 @@ class JWTPayload(TypedDict, total=False):
     scopes: list[str]
 
 
+class CachedToken(NamedTuple):
+    payload: JWTPayload
+    scopes: frozenset[str]
+
+
+class TokenCache:
+    _entries: LRUCache[str, CachedToken] = LRUCache(settings.TOKEN_CACHE_SIZE)
+    # revoked jtis only need to outlive the entries that could still reference them
+    _revoked: LRUCache[str, bool] = LRUCache(settings.TOKEN_CACHE_SIZE)
+
+    @classmethod
+    def get(cls, token: str) -> CachedToken | None:
+        cached = cls._entries.get(token)
+        if cached is None:
+            return None
+        if cached.payload["jti"] in cls._revoked:
+            cls._entries.pop(token)
+            return None
+        return cached
+
+    @classmethod
+    def set(cls, token: str, payload: JWTPayload, scopes: frozenset[str]) -> None:
+        ttl = min(settings.TOKEN_CACHE_MAX_AGE, payload["exp"] - time.time())
+        cls._entries.set(token, CachedToken(payload, scopes), ttl)
+
+    @classmethod
+    def evict(cls, jti: str) -> None:
+        cls._revoked.set(jti, True, settings.TOKEN_CACHE_MAX_AGE)
+
+    @classmethod
+    def clear(cls) -> None:
+        cls._entries.clear()
+        cls._revoked.clear()
+
+    @classmethod
+    def stats(cls) -> dict[str, int]:
+        return cls._entries.stats()
+
+
+class RevokedTokens:
+    # per-worker copy of auth:revoked, kept current by the revocation channel and a periodic full resync
+    _revoked: dict[str, float] = {}
+    _task: asyncio.Task | None = None
+
+    @classmethod
+    def contains(cls, jti: str) -> bool:
+        exp = cls._revoked.get(jti)
+        return exp is not None and exp > time.time()
+
+    @classmethod
+    def add(cls, revoked: dict[str, float]) -> None:
+        cls._revoked.update(revoked)
+        for jti in revoked:
+            TokenCache.evict(jti)
+
+    @classmethod
+    async def resync(cls, redis: Redis) -> None:
+        entries = await redis.zrangebyscore(RedisKey.REVOKED(), int(time.time()), "+inf", withscores=True)
+        revoked = {parse_bytes_to_str(jti): exp for jti, exp in entries}
+        # a revocation whose message was missed is only found here, its cached entries go with it
+        for jti in revoked.keys() - cls._revoked.keys():
+            TokenCache.evict(jti)
+        cls._revoked = revoked
+
+    @classmethod
+    async def _listen(cls, redis: Redis) -> None:
+        while True:
+            try:
+                async with redis.pubsub(ignore_subscribe_messages=True) as pubsub:
+                    await pubsub.subscribe(RedisKey.REVOKED_CHANNEL())
+                    await cls.resync(redis)
+                    resync_at = time.monotonic() + settings.TOKEN_REVOKED_RESYNC_SECONDS
+                    while True:
+                        message = await pubsub.get_message(timeout=max(resync_at - time.monotonic(), 0))
+                        if message:
+                            cls.add(json.loads(message["data"]))
+                        if time.monotonic() >= resync_at:
+                            await cls.resync(redis)
+                            resync_at = time.monotonic() + settings.TOKEN_REVOKED_RESYNC_SECONDS
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logging.exception("Revoked token listener failed, reconnecting.")
+                await asyncio.sleep(1)
+
+    @classmethod
+    def start(cls, auth_redis_pool: ConnectionPool) -> None:
+        if cls._task is None:
+            cls._task = asyncio.create_task(cls._listen(Redis(connection_pool=auth_redis_pool)))
+
+    @classmethod
+    async def stop(cls) -> None:
+        if cls._task is not None:
+            cls._task.cancel()
+            try:
+                await cls._task
+            except asyncio.CancelledError:
+                pass
+            cls._task = None
+
+    @classmethod
+    def stats(cls) -> dict[str, int]:
+        return {"revoked": len(cls._revoked)}
+
+
 class Token:
 
     @staticmethod
@@ -36,13 +149,15 @@ class Token:
 
     @staticmethod
     def _encode(payload: JWTPayload) -> str:
+        if KeySet.asymmetric():
+            return KeySet.encode(payload)
         return jwt.encode(payload, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
 
     @staticmethod
     def _decode(token: str) -> JWTPayload:
         return jwt.decode(
             jwt=token,
-            key=settings.SECRET_KEY,
+            key=KeySet.key(token) if KeySet.asymmetric() else settings.SECRET_KEY,
             algorithms=[settings.ALGORITHM],
             options={
                 "verify_exp": True,
@@ -56,85 +171,107 @@ class Token:
             leeway=settings.LEEWAY,
         )
 
-    @classmethod
-    async def _allow(cls, redis: Redis, token_type: TokenType, subject: str, jti: str, ttl: int) -> None:
-        allow_key = RedisKey.ALLOW(token_type, jti)
-        token_key = RedisKey.TOKEN(token_type, subject)
-        async with redis.pipeline() as pipeline:
-            pipeline.set(allow_key, subject, ex=ttl)
-            pipeline.sadd(token_key, jti)
-            pipeline.expire(token_key, ttl)
-            await pipeline.execute()
+    @staticmethod
+    def store() -> type["KeyStore | ZSetStore"]:
+        return ZSetStore if settings.TOKEN_STORE == "zset" else KeyStore
 
     @classmethod
-    async def _revoke(cls, redis: Redis, token_type: TokenType, jti: str) -> None:
-        allow_key = RedisKey.ALLOW(token_type, jti)
-        subject = await redis.get(allow_key)
-        subject = subject.decode() if isinstance(subject, (bytes, bytearray)) else subject
-        if subject:
-            token_key = RedisKey.TOKEN(token_type, subject)
-            async with redis.pipeline() as pipeline:
-                pipeline.delete(allow_key)
-                pipeline.srem(token_key, jti)
-                await pipeline.execute()
+    async def _revoke(cls, redis: Redis, token_type: TokenType, subject: str, jti: str) -> None:
+        TokenCache.evict(jti)
+        await cls.store().revoke(redis, token_type, subject, jti)
 
     @classmethod
-    async def create(cls, redis: Redis, token_type: TokenType, subject: str, scopes: list[str]) -> str:
-        jti = str(uuid.uuid4())
-        now = datetime.now(timezone.utc)
-        expire = cls.expire(token_type)
+    def _issue(cls, token_type: TokenType, subject: str, scopes: list[str]) -> tuple[str, JWTPayload]:
+        now = int(datetime.now(timezone.utc).timestamp())
         payload = JWTPayload(
             sub=subject,
             type=token_type.value,
-            jti=jti,
-            iat=int(now.timestamp()),
-            nbf=int(now.timestamp()),
-            exp=int(now.timestamp()) + expire,
+            jti=str(uuid.uuid4()),
+            iat=now,
+            nbf=now,
+            exp=now + cls.expire(token_type),
             iss=settings.ISSUER,
             aud=settings.AUDIENCE,
             scopes=scopes,
         )
-        token = cls._encode(payload)
-        await cls._allow(redis, token_type, subject, jti, expire)
+        with timed("jwt"):
+            return cls._encode(payload), payload
+
+    @classmethod
+    async def create(cls, redis: Redis, token_type: TokenType, subject: str, scopes: list[str]) -> str:
+        token, payload = cls._issue(token_type, subject, scopes)
+        await cls.store().allow(redis, subject, [payload])
         return token
 
     @classmethod
-    async def verify(cls, redis: Redis, token_type: TokenType, token: str) -> JWTPayload:
-        try:
-            payload = cls._decode(token)
-        except Exception:
-            raise
+    async def create_pair(cls, redis: Redis, subject: str, scopes: list[str]) -> tuple[str, str]:
+        access_token, access_payload = cls._issue(TokenType.ACCESS, subject, scopes)
+        refresh_token, refresh_payload = cls._issue(TokenType.REFRESH, subject, scopes)
+        await cls.store().allow(redis, subject, [access_payload, refresh_payload])
+        return access_token, refresh_token
+
+    @classmethod
+    def _claims(cls, token_type: TokenType, token: str) -> JWTPayload:
+        payload = cls._decode(token)
         if payload.get("type") != token_type.value:
             raise InvalidTokenError()
-        sub = payload.get("sub")
-        if not sub:
+        if not payload.get("sub"):
             raise InvalidTokenError()
-        jti = payload.get("jti")
-        if not jti:
+        if not payload.get("jti"):
             raise InvalidTokenError()
-        allow_key = RedisKey.ALLOW(token_type, jti)
-        if not await redis.exists(allow_key):
+        return payload
+
+    @classmethod
+    async def verify(cls, redis: Redis, token_type: TokenType, token: str) -> JWTPayload:
+        with timed("jwt"):
+            payload = cls._claims(token_type, token)
+        if settings.TOKEN_VERIFY_MODE == "local":
+            if RevokedTokens.contains(payload["jti"]):
+                raise InvalidTokenError()
+        elif not await cls.store().exists(redis, token_type, payload["sub"], payload["jti"]):
             raise InvalidTokenError()
         return payload
 
+    @classmethod
+    def _claims_many(cls, token_type: TokenType, tokens: list[str]) -> list[JWTPayload | None]:
+        payloads = []
+        for token in tokens:
+            try:
+                payloads.append(cls._claims(token_type, token))
+            except Exception:
+                payloads.append(None)
+        return payloads
+
+    @classmethod
+    async def verify_many(cls, redis: Redis, token_type: TokenType, tokens: list[str]) -> list[JWTPayload | None]:
+        # decoding a batch is CPU bound, so it runs off the event loop to keep other requests moving
+        with timed("jwt"):
+            payloads = await asyncio.to_thread(cls._claims_many, token_type, tokens)
+        indexes = [i for i, payload in enumerate(payloads) if payload is not None]
+        if settings.TOKEN_VERIFY_MODE == "local":
+            allowed = [not RevokedTokens.contains(payloads[i]["jti"]) for i in indexes]
+        else:
+            allowed = await cls.store().exists_many(
+                redis, token_type, [(payloads[i]["sub"], payloads[i]["jti"]) for i in indexes]
+            )
+        for i, ok in zip(indexes, allowed):
+            if not ok:
+                payloads[i] = None
+        return payloads
+
     @classmethod
     async def refresh(cls, redis: Redis, token: str) -> str:
-        try:
-            payload = await cls.verify(redis, TokenType.REFRESH, token)
-        except Exception:
-            raise
-        await cls._revoke(redis, TokenType.ACCESS, payload["jti"])
-        access_token = await cls.create(redis, TokenType.ACCESS, payload["sub"], payload["scopes"])
+        with timed("jwt"):
+            payload = cls._claims(TokenType.REFRESH, token)
+        access_token, access_payload = cls._issue(TokenType.ACCESS, payload["sub"], payload["scopes"])
+        if not await cls.store().refresh(redis, payload["sub"], payload["jti"], access_payload):
+            raise InvalidTokenError()
         return access_token
 
     @classmethod
     async def clear(cls, redis: Redis, subject: str):
-        async with asyncio.TaskGroup() as task_group:
-            for token_type in (TokenType.ACCESS, TokenType.REFRESH):
-                jti_set = await redis.smembers(RedisKey.TOKEN(token_type, subject))
-                for jti in jti_set:
-                    jti = jti.decode() if isinstance(jti, (bytes, bytearray)) else jti
-                    task_group.create_task(cls._revoke(redis, token_type, jti))
+        for jti in await cls.store().clear(redis, subject):
+            TokenCache.evict(jti)
 
     @staticmethod
     def extract(header_value: str | None) -> str | None:
@@ -144,3 +281,209 @@ class Token:
         if len(parts) != 2 or parts[0].lower() != "bearer":
             return None
         return parts[1]
+
+
+# revoked jtis are recorded in auth:revoked scored by their exp and published for RevokedTokens
+_TRACK = f"""
+local now = tonumber(redis.call("TIME")[1])
+local revoked = {{}}
+local function track(jti, exp)
+    exp = tonumber(exp)
+    if exp and exp > now then
+        revoked[jti] = exp
+    end
+end
+local function publish()
+    if next(revoked) == nil then
+        return
+    end
+    redis.call("ZREMRANGEBYSCORE", "{RedisKey.REVOKED()}", "-inf", now)
+    for jti, exp in pairs(revoked) do
+        redis.call("ZADD", "{RedisKey.REVOKED()}", exp, jti)
+    end
+    redis.call("PUBLISH", "{RedisKey.REVOKED_CHANNEL()}", cjson.encode(revoked))
+end
+"""
+
+
+class KeyStore:
+    # one string key per jti plus a per-subject set used to find them again on clear
+
+    # KEYS: (allow, token) per token, ARGV: subject, then (jti, exp) per token
+    # per-subject keys only ever extend their expiry (GT, or NX while they have none), a token issued under a
+    # shorter lifetime setting must not expire the older tokens sharing the key
+    _allow = register_script("""
+for i = 1, #KEYS, 2 do
+    redis.call("SET", KEYS[i], ARGV[1], "EXAT", ARGV[i + 2])
+    redis.call("SADD", KEYS[i + 1], ARGV[i + 1])
+    redis.call("EXPIREAT", KEYS[i + 1], ARGV[i + 2], "GT")
+    redis.call("EXPIREAT", KEYS[i + 1], ARGV[i + 2], "NX")
+end
+""")
+    # KEYS: allow, token set, ARGV: jti
+    _revoke = register_script(_TRACK + """
+local exp = redis.call("EXPIRETIME", KEYS[1])
+if redis.call("DEL", KEYS[1]) == 1 then
+    track(ARGV[1], exp)
+end
+redis.call("SREM", KEYS[2], ARGV[1])
+publish()
+""")
+    # KEYS: refresh allow, access token set, new access allow, ARGV: subject, new access jti, new access exp
+    # access tokens issued earlier are left to expire, nothing links them to the refresh token
+    _refresh = register_script("""
+if redis.call("EXISTS", KEYS[1]) == 0 then
+    return 0
+end
+redis.call("SET", KEYS[3], ARGV[1], "EXAT", ARGV[3])
+redis.call("SADD", KEYS[2], ARGV[2])
+redis.call("EXPIREAT", KEYS[2], ARGV[3], "GT")
+redis.call("EXPIREAT", KEYS[2], ARGV[3], "NX")
+return 1
+""")
+    # KEYS: token set per type, ARGV: allow key prefix per type
+    _clear = register_script(_TRACK + """
+local jtis = {}
+for i = 1, #KEYS do
+    for _, jti in ipairs(redis.call("SMEMBERS", KEYS[i])) do
+        local exp = redis.call("EXPIRETIME", ARGV[i] .. jti)
+        if redis.call("DEL", ARGV[i] .. jti) == 1 then
+            track(jti, exp)
+        end
+        jtis[#jtis + 1] = jti
+    end
+    redis.call("DEL", KEYS[i])
+end
+publish()
+return jtis
+""")
+
+    @classmethod
+    async def allow(cls, redis: Redis, subject: str, payloads: list[JWTPayload]) -> None:
+        keys, args = [], [subject]
+        for payload in payloads:
+            token_type = TokenType(payload["type"])
+            keys += [RedisKey.ALLOW(token_type, payload["jti"]), RedisKey.TOKEN(token_type, subject)]
+            args += [payload["jti"], payload["exp"]]
+        await cls._allow(keys, args, client=redis)
+
+    @staticmethod
+    async def exists(redis: Redis, token_type: TokenType, subject: str, jti: str) -> bool:
+        allow_key = RedisKey.ALLOW(token_type, jti)
+        return bool(await ClientCache.get(allow_key, ("EXISTS",), lambda: redis.exists(allow_key)))
+
+    @staticmethod
+    async def exists_many(redis: Redis, token_type: TokenType, tokens: list[tuple[str, str]]) -> list[bool]:
+        if not tokens:
+            return []
+        values = await redis.mget([RedisKey.ALLOW(token_type, jti) for _, jti in tokens])
+        return [value is not None for value in values]
+
+    @classmethod
+    async def revoke(cls, redis: Redis, token_type: TokenType, subject: str, jti: str) -> None:
+        await cls._revoke([RedisKey.ALLOW(token_type, jti), RedisKey.TOKEN(token_type, subject)], [jti], client=redis)
+
+    @classmethod
+    async def refresh(cls, redis: Redis, subject: str, jti: str, payload: JWTPayload) -> bool:
+        keys = [
+            RedisKey.ALLOW(TokenType.REFRESH, jti),
+            RedisKey.TOKEN(TokenType.ACCESS, subject),
+            RedisKey.ALLOW(TokenType.ACCESS, payload["jti"]),
+        ]
+        return bool(await cls._refresh(keys, [subject, payload["jti"], payload["exp"]], client=redis))
+
+    @classmethod
+    async def clear(cls, redis: Redis, subject: str) -> list[str]:
+        token_types = (TokenType.ACCESS, TokenType.REFRESH)
+        keys = [RedisKey.TOKEN(token_type, subject) for token_type in token_types]
+        args = [RedisKey.ALLOW(token_type, "") for token_type in token_types]
+        return [parse_bytes_to_str(jti) for jti in await cls._clear(keys, args, client=redis)]
+
+
+class ZSetStore:
+    # one sorted set per subject, members are jtis scored by their exp, expired members are pruned on write
+
+    # KEYS: tokens per token, ARGV: now, then (jti, exp) per token
+    # the expiry only ever extends, as in KeyStore
+    _allow = register_script("""
+for i = 1, #KEYS do
+    redis.call("ZREMRANGEBYSCORE", KEYS[i], "-inf", ARGV[1])
+    redis.call("ZADD", KEYS[i], ARGV[i * 2 + 1], ARGV[i * 2])
+    redis.call("EXPIREAT", KEYS[i], ARGV[i * 2 + 1], "GT")
+    redis.call("EXPIREAT", KEYS[i], ARGV[i * 2 + 1], "NX")
+end
+""")
+    # KEYS: tokens, ARGV: jti
+    _revoke = register_script(_TRACK + """
+local exp = redis.call("ZSCORE", KEYS[1], ARGV[1])
+if exp then
+    redis.call("ZREM", KEYS[1], ARGV[1])
+    track(ARGV[1], exp)
+end
+publish()
+""")
+    # KEYS: refresh tokens, access tokens, ARGV: now, refresh jti, new access jti, new access exp
+    # access tokens issued earlier are left to expire, nothing links them to the refresh token
+    _refresh = register_script("""
+local refresh_exp = redis.call("ZSCORE", KEYS[1], ARGV[2])
+if not refresh_exp or tonumber(refresh_exp) <= tonumber(ARGV[1]) then
+    return 0
+end
+redis.call("ZREMRANGEBYSCORE", KEYS[2], "-inf", ARGV[1])
+redis.call("ZADD", KEYS[2], ARGV[4], ARGV[3])
+redis.call("EXPIREAT", KEYS[2], ARGV[4], "GT")
+redis.call("EXPIREAT", KEYS[2], ARGV[4], "NX")
+return 1
+""")
+    # KEYS: tokens per type, ARGV: now
+    _clear = register_script(_TRACK + """
+local jtis = {}
+for i = 1, #KEYS do
+    local entries = redis.call("ZRANGEBYSCORE", KEYS[i], "(" .. ARGV[1], "+inf", "WITHSCORES")
+    for j = 1, #entries, 2 do
+        track(entries[j], entries[j + 1])
+        jtis[#jtis + 1] = entries[j]
+    end
+    redis.call("DEL", KEYS[i])
+end
+publish()
+return jtis
+""")
+
+    @classmethod
+    async def allow(cls, redis: Redis, subject: str, payloads: list[JWTPayload]) -> None:
+        keys, args = [], [int(time.time())]
+        for payload in payloads:
+            keys.append(RedisKey.TOKENS(TokenType(payload["type"]), subject))
+            args += [payload["jti"], payload["exp"]]
+        await cls._allow(keys, args, client=redis)
+
+    @staticmethod
+    async def exists(redis: Redis, token_type: TokenType, subject: str, jti: str) -> bool:
+        tokens_key = RedisKey.TOKENS(token_type, subject)
+        exp = await ClientCache.get(tokens_key, ("ZSCORE", jti), lambda: redis.zscore(tokens_key, jti))
+        return exp is not None and exp > time.time()
+
+    @staticmethod
+    async def exists_many(redis: Redis, token_type: TokenType, tokens: list[tuple[str, str]]) -> list[bool]:
+        async with redis.pipeline(transaction=False) as pipeline:
+            for subject, jti in tokens:
+                pipeline.zscore(RedisKey.TOKENS(token_type, subject), jti)
+            exps = await pipeline.execute()
+        now = time.time()
+        return [exp is not None and exp > now for exp in exps]
+
+    @classmethod
+    async def revoke(cls, redis: Redis, token_type: TokenType, subject: str, jti: str) -> None:
+        await cls._revoke([RedisKey.TOKENS(token_type, subject)], [jti], client=redis)
+
+    @classmethod
+    async def refresh(cls, redis: Redis, subject: str, jti: str, payload: JWTPayload) -> bool:
+        keys = [RedisKey.TOKENS(TokenType.REFRESH, subject), RedisKey.TOKENS(TokenType.ACCESS, subject)]
+        args = [int(time.time()), jti, payload["jti"], payload["exp"]]
+        return bool(await cls._refresh(keys, args, client=redis))
+
+    @classmethod
+    async def clear(cls, redis: Redis, subject: str) -> list[str]:
+        keys = [RedisKey.TOKENS(token_type, subject) for token_type in (TokenType.ACCESS, TokenType.REFRESH)]
+        return [parse_bytes_to_str(jti) for jti in await cls._clear(keys, [int(time.time())], client=redis)]
@@ -0,0 +1,120 @@
+import functools
+import hashlib
+from typing import Awaitable, Callable, ParamSpec, Sequence, TypeVar, get_type_hints
+
+from pydantic import BaseModel, TypeAdapter
+from redis.asyncio import Redis
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database.redis import ClientCache, get_session_redis
+from app.decorators.singleflight import SingleFlight
+from app.utils.cache import LRUCache
+
+P = ParamSpec("P")
+T = TypeVar("T")
+
+TAG_PREFIX = f"{settings.CACHE_KEY_PREFIX}tag:"
+
+_MISS = object()
+# tag versions of this process, the only source of truth when there is no redis
+_versions: dict[str, int] = {}
+
+
+def model_key(*args, **kwargs) -> str:
+    parts = [
+        value.model_dump_json(exclude_unset=True, exclude_defaults=True)
+        for value in (*args, *kwargs.values())
+        if isinstance(value, BaseModel)
+    ]
+    return hashlib.blake2b("|".join(parts).encode(), digest_size=16).hexdigest()
+
+
+def fill_ttl(session: AsyncSession | None, ttl: int) -> int:
+    # entries are keyed by fresh versions, rows from a lagging replica may predate them, so they are kept briefly
+    if session is not None and session.info.get("auth_replica_read"):
+        return min(ttl, settings.MYSQL_REPLICA_CACHE_TTL)
+    return ttl
+
+
+def _find_session(*args, **kwargs) -> AsyncSession | None:
+    return next((value for value in (*args, *kwargs.values()) if isinstance(value, AsyncSession)), None)
+
+
+def _with_session(session: AsyncSession, *args, **kwargs) -> tuple[tuple, dict]:
+    args = tuple(session if isinstance(value, AsyncSession) else value for value in args)
+    kwargs = {name: session if isinstance(value, AsyncSession) else value for name, value in kwargs.items()}
+    return args, kwargs
+
+
+async def _tag_versions(redis: Redis | None, tags: Sequence[str]) -> list[int]:
+    if redis is None:
+        return [_versions.get(tag, 0) for tag in tags]
+    versions = []
+    for tag in tags:
+        tag_key = TAG_PREFIX + tag
+        versions.append(int(await ClientCache.get(tag_key, ("GET",), lambda: redis.get(tag_key)) or 0))
+    return versions
+
+
+async def invalidate_tags(session: AsyncSession, *tags: str) -> None:
+    # entries are keyed by tag version, so bumping a version orphans them in every process until their ttl
+    for tag in tags:
+        _versions[tag] = _versions.get(tag, 0) + 1
+    if tags and (redis := get_session_redis(session)):
+        keys = [TAG_PREFIX + tag for tag in tags]
+        async with redis.pipeline(transaction=False) as pipeline:
+            for key in keys:
+                pipeline.incr(key)
+            await pipeline.execute()
+        ClientCache.invalidate(keys)
+
+
+def cached(
+        tags: Sequence[str],
+        key: Callable[..., str] = model_key,
+        ttl: float = settings.CACHE_TTL,
+        maxsize: int = settings.CACHE_SIZE,
+) -> Callable[[Callable[P, Awaitable[T]]], Callable[P, Awaitable[T]]]:
+    def decorator(func: Callable[P, Awaitable[T]]) -> Callable[P, Awaitable[T]]:
+        adapter = TypeAdapter(get_type_hints(func)["return"])
+        local: LRUCache[str, T] = LRUCache(maxsize)
+        flight = SingleFlight()
+        name = f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        async def wrapper(*args: P.args, **kwargs: P.kwargs) -> T:
+            session = _find_session(*args, **kwargs)
+            redis = get_session_redis(session) if session is not None else None
+            versions = await _tag_versions(redis, tags)
+            cache_key = f"{settings.CACHE_KEY_PREFIX}{name}:{'.'.join(map(str, versions))}:{key(*args, **kwargs)}"
+            if (value := local.get(cache_key, _MISS)) is not _MISS:
+                return value
+
+            async def load() -> tuple[T, int]:
+                shared = redis if settings.CACHE_REDIS else None
+                if shared is not None and (raw := await shared.get(cache_key)) is not None:
+                    return adapter.validate_json(raw), max(int(await shared.ttl(cache_key)), 1)
+                session_maker = session.info.get("auth_session_maker") if session is not None else None
+                # the fill is shared by every waiter, so it runs on a session none of them owns,
+                # unless the caller is inside a transaction and may depend on its own uncommitted writes
+                if session_maker is None or session.in_transaction():
+                    result = await func(*args, **kwargs)
+                    entry_ttl = fill_ttl(session, int(ttl))
+                else:
+                    async with session_maker() as own_session:
+                        own_args, own_kwargs = _with_session(own_session, *args, **kwargs)
+                        result = await func(*own_args, **own_kwargs)
+                        entry_ttl = fill_ttl(own_session, int(ttl))
+                if shared is not None:
+                    await shared.set(cache_key, adapter.dump_json(result), ex=entry_ttl)
+                return result, entry_ttl
+
+            (value, entry_ttl), _ = await flight.do(cache_key, load)
+            local.set(cache_key, value, entry_ttl)
+            return value
+
+        wrapper.cache = local  # type: ignore[attr-defined]
+        return wrapper
+
+    return decorator
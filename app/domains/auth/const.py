@@ -6,6 +6,20 @@ class TokenType(str, Enum):
     REFRESH = "refresh"
 
 
+class BatchTarget(str, Enum):
+    USER = "user"
+    ROLE = "role"
+    PERMISSION = "permission"
+    USER_ROLE = "user_role"
+    ROLE_PERMISSION = "role_permission"
+
+
+class BatchAction(str, Enum):
+    CREATE = "create"
+    UPDATE = "update"
+    DELETE = "delete"
+
+
 class RedisKey:
     @staticmethod
     def ALLOW(token_type: TokenType, jti: str) -> str:
@@ -14,3 +28,27 @@ class RedisKey:
     @classmethod
     def TOKEN(cls, token_type: TokenType, subject: str) -> str:
         return f"auth:token:{token_type.value}:{subject}"
+
+    @staticmethod
+    def TOKENS(token_type: TokenType, subject: str) -> str:
+        return f"auth:tokens:{token_type.value}:{subject}"
+
+    @staticmethod
+    def REVOKED() -> str:
+        return "auth:revoked"
+
+    @staticmethod
+    def REVOKED_CHANNEL() -> str:
+        return "auth:revoked:events"
+
+    @staticmethod
+    def TRACKING_PREFIXES() -> list[str]:
+        return ["auth:allow:", "auth:tokens:", "auth:scopes:", "auth:rbac:"]
+
+    @staticmethod
+    def RBAC_VERSION() -> str:
+        return "auth:rbac:version"
+
+    @staticmethod
+    def SCOPES(version: int, subject: str) -> str:
+        return f"auth:scopes:{version}:{subject}"
@@ -1,53 +1,317 @@
-from passlib.context import CryptContext
-from sqlalchemy.ext.asyncio import AsyncSession
+from collections import defaultdict
+from datetime import datetime
+from typing import AsyncIterator, Sequence
 
-from app.domains.auth.exception import UserError
-from app.domains.auth.schema import UserSelect, UserCreate, UserUpdate
+from sqlalchemy import bindparam, or_
+from sqlalchemy.dialects.mysql import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.sql.base import ExecutableOption
+from sqlmodel import select
+
+from app.core.password import Password
+from app.core.scope import Scope
+from app.domains.auth.exception import UserError, RoleError
+from app.domains.auth.schema import UserCreate, UserUpdate, UserDelete, UserCredential, UserImport, UserImportResult
 from app.domains.base_curd import Curd
+from app.domains.base_exception import Error
 from app.models.auth import User, Role, Permission, UserRoleLink, RolePermissionLink
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+_CREDENTIAL_STMT = (
+    select(User.id, User.username, User.password, Permission.scope)
+    .outerjoin(UserRoleLink, UserRoleLink.uid == User.id)
+    .outerjoin(RolePermissionLink, RolePermissionLink.rid == UserRoleLink.rid)
+    .outerjoin(Permission, Permission.id == RolePermissionLink.pid)
+    .where(User.username == bindparam("username"))
+    .distinct()
+)
+
+_SCOPES_STMT = (
+    select(User.username, Permission.scope)
+    .outerjoin(UserRoleLink, UserRoleLink.uid == User.id)
+    .outerjoin(RolePermissionLink, RolePermissionLink.rid == UserRoleLink.rid)
+    .outerjoin(Permission, Permission.id == RolePermissionLink.pid)
+    .where(User.username.in_(bindparam("usernames", expanding=True)))
+    .distinct()
+)
+
+_GRANT_STMT = (
+    select(UserRoleLink.uid, Role.name, Permission.scope)
+    .join(Role, Role.id == UserRoleLink.rid)
+    .outerjoin(RolePermissionLink, RolePermissionLink.rid == Role.id)
+    .outerjoin(Permission, Permission.id == RolePermissionLink.pid)
+    .where(UserRoleLink.uid.in_(bindparam("uids", expanding=True)))
+)
 
 
 class UserCurd(Curd):
     model = User
+    unique = "username"
+    tags = ("user",)
+
+    @classmethod
+    async def credential(cls, session: AsyncSession, username: str) -> UserCredential | None:
+        result = await session.execute(_CREDENTIAL_STMT, {"username": username})
+        rows = result.all()
+        if not rows:
+            return None
+        return UserCredential(
+            id=rows[0].id,
+            username=rows[0].username,
+            password=rows[0].password,
+            scopes=[row.scope for row in rows if row.scope is not None],
+        )
+
+    @classmethod
+    async def scopes_many(cls, session: AsyncSession, usernames: Sequence[str]) -> dict[str, list[str]]:
+        result = await session.execute(_SCOPES_STMT, {"usernames": list(usernames)})
+        scopes: dict[str, list[str]] = {}
+        for username, scope in result:
+            user_scopes = scopes.setdefault(username, [])
+            if scope is not None:
+                user_scopes.append(scope)
+        return scopes
 
     @classmethod
-    async def authenticate(cls, session: AsyncSession, username: str, password: str) -> User:
-        user = await cls.select(session, UserSelect(username=username))
-        if not pwd_context.verify(password, user.password):
+    async def export(
+            cls,
+            session_maker: async_sessionmaker[AsyncSession],
+            chunk_size: int,
+    ) -> AsyncIterator[list[dict]]:
+        # the streaming connection is busy until the cursor is drained, so grants are joined on a second one
+        async with session_maker() as stream_session, session_maker() as session:
+            result = await stream_session.stream(
+                select(User.id, User.username, User.email, User.created_at, User.updated_at)
+                .order_by(User.id)
+                .execution_options(yield_per=chunk_size)
+            )
+            async for rows in result.partitions(chunk_size):
+                roles, scopes = defaultdict(set), defaultdict(set)
+                grants = await session.execute(_GRANT_STMT, {"uids": [row.id for row in rows]})
+                for uid, role, scope in grants:
+                    roles[uid].add(role)
+                    if scope is not None:
+                        scopes[uid].add(scope)
+                yield [
+                    {
+                        "id": row.id,
+                        "username": row.username,
+                        "email": row.email,
+                        "created_at": row.created_at.isoformat() if row.created_at else None,
+                        "updated_at": row.updated_at.isoformat() if row.updated_at else None,
+                        "roles": sorted(roles[row.id]),
+                        "scopes": sorted(scopes[row.id]),
+                    }
+                    for row in rows
+                ]
+
+    @classmethod
+    async def authenticate(cls, session: AsyncSession, username: str, password: str) -> UserCredential:
+        user = await cls.credential(session, username)
+        if not user:
+            raise Exception(UserError.NOT_FOUND)
+        if not await Password.verify(password, user.password):
             raise Exception(UserError.INCORRECT_PASSWORD)
         return user
 
     @classmethod
-    async def create(cls, session: AsyncSession, user_in: UserCreate, update: dict | None = None) -> User:
+    async def bulk_import(
+            cls,
+            session: AsyncSession,
+            rows: list[tuple[int, UserImport]],
+            roles: dict[str, int],
+            upsert: bool,
+            result: UserImportResult,
+    ) -> None:
+        batch: dict[str, tuple[int, UserImport]] = {}
+        for line, row in rows:
+            if row.username in batch:
+                result.fail(line, row.username, UserError.DUPLICATED)
+            elif row.password_hash and not Password.identify(row.password_hash):
+                result.fail(line, row.username, UserError.INVALID_PASSWORD_HASH)
+            else:
+                batch[row.username] = (line, row)
+        if not batch:
+            return
+
+        emails = [row.email for _, row in batch.values() if row.email]
+        existing = await session.execute(
+            select(User.username, User.email).where(or_(User.username.in_(batch), User.email.in_(emails)))
+        )
+        usernames, email_owners = set(), {}
+        for username, email in existing:
+            usernames.add(username)
+            if email:
+                email_owners[email] = username
+        if missing := {name for _, row in batch.values() for name in row.roles} - roles.keys():
+            roles.update((name, rid) for rid, name in await session.execute(
+                select(Role.id, Role.name).where(Role.name.in_(missing))
+            ))
+
+        writes: list[tuple[int, UserImport]] = []
+        for username, (line, row) in batch.items():
+            if row.email and email_owners.get(row.email, username) != username:
+                result.fail(line, username, UserError.EMAIL_EXISTS)
+            elif unknown := [name for name in row.roles if name not in roles]:
+                result.fail(line, username, f"{RoleError.NOT_FOUND}: {', '.join(unknown)}")
+            elif username in usernames and not upsert:
+                result.skipped += 1
+            else:
+                writes.append((line, row))
+                # a later row of this batch with the same email would hit the unique key of this one
+                if row.email:
+                    email_owners[row.email] = username
+        if not writes:
+            return
+
+        try:
+            hashed = iter(await Password.hash_many([row.password for _, row in writes if not row.password_hash]))
+            now = datetime.now()
+            stmt = insert(User.__table__).values([
+                {
+                    "username": row.username,
+                    "password": row.password_hash or next(hashed),
+                    "email": row.email,
+                    "created_at": now,
+                    "updated_at": now,
+                }
+                for _, row in writes
+            ])
+            if upsert:
+                stmt = stmt.on_duplicate_key_update(
+                    password=stmt.inserted.password,
+                    email=stmt.inserted.email,
+                    updated_at=stmt.inserted.updated_at,
+                )
+            else:
+                stmt = stmt.prefix_with("IGNORE")
+            inserted = (await session.execute(stmt)).rowcount
+
+            # a row written concurrently since the checks above can make a row collide on another unique key
+            emails = {row.username: row.email for _, row in writes}
+            landed = {
+                username: uid
+                for username, uid, email in await session.execute(
+                    select(User.username, User.id, User.email).where(User.username.in_(emails))
+                )
+                if email == emails[username]
+            }
+            missing = [(line, row) for line, row in writes if row.username not in landed]
+            if upsert and missing:
+                # the upsert updated some other user's row through its email, none of the batch can be kept
+                raise Exception(UserError.CONFLICT)
+            if not upsert and inserted != len(writes) - len(missing):
+                raise Exception(UserError.CONFLICT)
+            for line, row in missing:
+                result.fail(line, row.username, UserError.CONFLICT)
+            writes = [(line, row) for line, row in writes if row.username in landed]
+
+            if grants := [(row.username, name) for _, row in writes for name in row.roles]:
+                link = insert(UserRoleLink.__table__).values([
+                    {"uid": landed[username], "rid": roles[name]} for username, name in grants
+                ])
+                await session.execute(link.on_duplicate_key_update(rid=link.inserted.rid))
+            await session.commit()
+        except Exception as e:
+            await session.rollback()
+            for line, row in writes:
+                result.fail(line, row.username, str(e) or Error.FAILURE)
+            return
+
+        for _, row in writes:
+            if row.username in usernames:
+                result.updated += 1
+            else:
+                result.created += 1
+
+    @classmethod
+    async def create(
+            cls,
+            session: AsyncSession,
+            user_in: UserCreate,
+            update: dict | None = None,
+            options: Sequence[ExecutableOption] | None = None,
+    ) -> User:
         update = update or {}
         update.update({
-            "password": pwd_context.hash(user_in.password),
+            "password": await Password.hash(user_in.password),
         })
-        return await super().create(session, user_in, update)
+        return await super().create(session, user_in, update, options)
 
     @classmethod
-    async def update(cls, session: AsyncSession, user_in: UserUpdate, update: dict | None = None) -> User:
+    async def update(
+            cls,
+            session: AsyncSession,
+            user_in: UserUpdate,
+            update: dict | None = None,
+            options: Sequence[ExecutableOption] | None = None,
+    ) -> User:
         update = update or {}
         if user_in.password:
             update.update({
-                "password": pwd_context.hash(user_in.password),
+                "password": await Password.hash(user_in.password),
             })
-        return await super().update(session, user_in, update)
+        user = await super().update(session, user_in, update, options)
+        await Scope.invalidate(session)
+        return user
+
+    @classmethod
+    async def delete(cls, session: AsyncSession, user_in: UserDelete) -> None:
+        await super().delete(session, user_in)
+        await Scope.invalidate(session)
+
+    @classmethod
+    async def create_many(
+            cls,
+            session: AsyncSession,
+            users_in: Sequence[UserCreate],
+            updates: Sequence[dict | None] | None = None,
+    ) -> list[User]:
+        updates = updates or [None] * len(users_in)
+        hashed = await Password.hash_many([user_in.password for user_in in users_in])
+        updates = [(update or {}) | {"password": password} for update, password in zip(updates, hashed)]
+        return await super().create_many(session, users_in, updates)
+
+    @classmethod
+    async def update_many(
+            cls,
+            session: AsyncSession,
+            users_in: Sequence[UserUpdate],
+            updates: Sequence[dict | None] | None = None,
+    ) -> None:
+        updates = updates or [None] * len(users_in)
+        hashed = iter(await Password.hash_many([user_in.password for user_in in users_in if user_in.password]))
+        updates = [
+            (update or {}) | {"password": next(hashed)} if user_in.password else update
+            for user_in, update in zip(users_in, updates)
+        ]
+        await super().update_many(session, users_in, updates)
+
+
+class RBACCurd(Curd):
+
+    @classmethod
+    async def after_write(cls, session: AsyncSession) -> None:
+        await super().after_write(session)
+        await Scope.invalidate(session)
 
 
-class RoleCurd(Curd):
+class RoleCurd(RBACCurd):
     model = Role
+    unique = "name"
+    tags = ("role", "user")
 
 
-class PermissionCurd(Curd):
+class PermissionCurd(RBACCurd):
     model = Permission
+    unique = "name"
+    tags = ("permission", "role", "user")
 
 
-class UserRoleCurd(Curd):
+class UserRoleCurd(RBACCurd):
     model = UserRoleLink
+    tags = ("user",)
 
 
-class RolePermissionCurd(Curd):
+class RolePermissionCurd(RBACCurd):
     model = RolePermissionLink
+    tags = ("role", "user")
@@ -8,6 +8,11 @@ class AuthError:
 class UserError:
     NOT_FOUND = "user not found"
     INCORRECT_PASSWORD = "Incorrect password."
+    DUPLICATED = "duplicated user"
+    EMAIL_EXISTS = "email already in use"
+    CONFLICT = "username or email was taken by a concurrent write"
+    INVALID_PASSWORD = "password or password_hash is required"
+    INVALID_PASSWORD_HASH = "unsupported password hash"
 
 
 class RoleError:
@@ -16,3 +21,7 @@ class RoleError:
 
 class PermError:
     NOT_FOUND = "permission not found"
+
+
+class GrantError:
+    NOT_FOUND = "grant not found"
@@ -1,10 +1,17 @@
 from datetime import datetime
+from typing import Annotated
 
-from pydantic import EmailStr
+from fastapi import status
+from pydantic import EmailStr, BeforeValidator, model_validator
 from sqlmodel import SQLModel, Field
 
+from app.core.config import settings
+from app.domains.auth.const import BatchTarget, BatchAction
+from app.domains.auth.exception import UserError
 from app.domains.base_schema import BaseData, BaseRequest
-from app.domains.base_schema import BaseSelect, BaseUpdate, BaseDelete
+from app.domains.base_exception import Error
+from app.domains.base_schema import BaseSelect, BaseUpdate, BaseDelete, BaseList, BasePage
+from app.utils.parse import parse_to_list
 
 
 class TokenData(BaseData):
@@ -21,17 +28,72 @@ class RefreshRequestBody(BaseRequest):
     refresh_token: str
 
 
+class IntrospectRequestBody(BaseRequest):
+    tokens: list[str] = Field(..., min_length=1, max_length=settings.INTROSPECT_MAX_TOKENS)
+
+
+class TokenIntrospection(SQLModel):
+    active: bool = Field(default=False)
+    sub: str | None = Field(default=None)
+    scopes: list[str] | None = Field(default=None)
+    exp: int | None = Field(default=None)
+
+
+class IntrospectResponse(BaseData):
+    results: list[TokenIntrospection] = Field(default_factory=list)
+
+
 class UserSelect(BaseSelect):
     username: str | None = Field(default=None, max_length=255)
     email: EmailStr | None = Field(default=None, max_length=255)
 
 
+class UserList(BaseList):
+    username: str | None = Field(default=None, max_length=255, description="username prefix")
+    email: str | None = Field(default=None, max_length=255, description="email prefix")
+
+
 class UserCreate(SQLModel):
     username: str = Field(..., max_length=255)
     password: str = Field(..., max_length=128)
     email: EmailStr | None = Field(default=None, max_length=255)
 
 
+class UserImport(SQLModel):
+    username: str = Field(..., max_length=255)
+    password: str | None = Field(default=None, max_length=128)
+    password_hash: str | None = Field(default=None, max_length=128)
+    email: EmailStr | None = Field(default=None, max_length=255)
+    roles: Annotated[list[str], BeforeValidator(lambda v: parse_to_list(v, ";") if isinstance(v, str) else v)] = Field(
+        default_factory=list
+    )
+
+    @model_validator(mode="after")
+    def check_password(self) -> "UserImport":
+        if not self.password and not self.password_hash:
+            raise ValueError(UserError.INVALID_PASSWORD)
+        return self
+
+
+class UserImportError(SQLModel):
+    line: int
+    username: str | None = Field(default=None)
+    detail: str
+
+
+class UserImportResult(BaseData):
+    total: int = Field(default=0)
+    created: int = Field(default=0)
+    updated: int = Field(default=0)
+    skipped: int = Field(default=0)
+    failed: int = Field(default=0)
+    errors: list[UserImportError] = Field(default_factory=list)
+
+    def fail(self, line: int, username: str | None, detail: str) -> None:
+        self.failed += 1
+        self.errors.append(UserImportError(line=line, username=username, detail=detail))
+
+
 class UserUpdate(BaseUpdate):
     username: str | None = Field(default=None, max_length=255)
     password: str | None = Field(default=None, max_length=128)
@@ -42,6 +104,13 @@ class UserDelete(BaseDelete):
     ...
 
 
+class UserCredential(SQLModel):
+    id: int
+    username: str
+    password: str
+    scopes: list[str] = Field(default_factory=list)
+
+
 class UserPublic(SQLModel):
     id: int
     username: str
@@ -56,6 +125,10 @@ class RoleSelect(BaseSelect):
     name: str | None = Field(default=None, max_length=255)
 
 
+class RoleList(BaseList):
+    name: str | None = Field(default=None, max_length=255, description="name prefix")
+
+
 class RoleCreate(SQLModel):
     name: str = Field(..., max_length=255)
 
@@ -81,6 +154,11 @@ class PermissionSelect(BaseSelect):
     name: str | None = Field(default=None, max_length=255)
 
 
+class PermissionList(BaseList):
+    name: str | None = Field(default=None, max_length=255, description="name prefix")
+    scope: str | None = Field(default=None, max_length=255, description="scope prefix")
+
+
 class PermissionCreate(SQLModel):
     name: str = Field(..., max_length=255)
     scope: str = Field(..., max_length=255)
@@ -106,6 +184,18 @@ class PermissionPublic(SQLModel):
     updated_at: datetime
 
 
+class UserPage(BasePage):
+    items: list[UserPublic] = Field(default_factory=list)
+
+
+class RolePage(BasePage):
+    items: list[RolePublic] = Field(default_factory=list)
+
+
+class PermissionPage(BasePage):
+    items: list[PermissionPublic] = Field(default_factory=list)
+
+
 class GrantRole(SQLModel):
     uid: int
     rid: int
@@ -114,3 +204,25 @@ class GrantRole(SQLModel):
 class GrantPermission(SQLModel):
     rid: int
     pid: int
+
+
+class BatchOperation(SQLModel):
+    target: BatchTarget
+    action: BatchAction
+    data: dict
+
+
+class BatchRequestBody(BaseRequest):
+    operations: list[BatchOperation] = Field(..., min_length=1, max_length=settings.BATCH_MAX_OPERATIONS)
+
+
+class BatchResult(SQLModel):
+    index: int
+    status_code: int = Field(default=status.HTTP_200_OK)
+    detail: str = Field(default=Error.SUCCESS)
+    data: dict | None = Field(default=None)
+
+
+class BatchResponse(BaseData):
+    committed: bool = Field(default=False)
+    results: list[BatchResult] = Field(default_factory=list)
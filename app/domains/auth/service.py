@@ -1,15 +1,58 @@
-from typing import Annotated
+import asyncio
+import itertools
+import json
+from typing import Annotated, AsyncIterator, Iterable, Iterator, Literal
 
-from fastapi import Depends
+from fastapi import Depends, status
 from fastapi.security import OAuth2PasswordRequestForm
+from pydantic import ValidationError
 from redis.asyncio import Redis
 
+from app.core.config import settings
+from app.core.scope import Scope
 from app.core.token import Token
-from app.domains.auth.const import TokenType
+from app.domains.auth.const import TokenType, BatchTarget, BatchAction
 from app.domains.auth.curd import *
+from app.domains.auth.exception import AuthError, RoleError, PermError, GrantError
 from app.domains.auth.schema import *
+from app.decorators.cache import cached, fill_ttl
+from app.domains.base_curd import Curd
+from app.domains.base_exception import Error
 from app.domains.base_service import BaseService
 from app.models.auth import *
+from app.utils.parse import parse_records
+
+_BATCH: dict[tuple[BatchTarget, BatchAction], tuple[type[Curd], type[SQLModel], str, str]] = {
+    (BatchTarget.USER, BatchAction.CREATE): (UserCurd, UserCreate, "user:create", UserError.NOT_FOUND),
+    (BatchTarget.USER, BatchAction.UPDATE): (UserCurd, UserUpdate, "user:update", UserError.NOT_FOUND),
+    (BatchTarget.USER, BatchAction.DELETE): (UserCurd, UserDelete, "user:delete", UserError.NOT_FOUND),
+    (BatchTarget.ROLE, BatchAction.CREATE): (RoleCurd, RoleCreate, "role:create", RoleError.NOT_FOUND),
+    (BatchTarget.ROLE, BatchAction.UPDATE): (RoleCurd, RoleUpdate, "role:update", RoleError.NOT_FOUND),
+    (BatchTarget.ROLE, BatchAction.DELETE): (RoleCurd, RoleDelete, "role:delete", RoleError.NOT_FOUND),
+    (BatchTarget.PERMISSION, BatchAction.CREATE): (PermissionCurd, PermissionCreate, "permission:create", PermError.NOT_FOUND),
+    (BatchTarget.PERMISSION, BatchAction.UPDATE): (PermissionCurd, PermissionUpdate, "permission:update", PermError.NOT_FOUND),
+    (BatchTarget.PERMISSION, BatchAction.DELETE): (PermissionCurd, PermissionDelete, "permission:delete", PermError.NOT_FOUND),
+    (BatchTarget.USER_ROLE, BatchAction.CREATE): (UserRoleCurd, GrantRole, "user:update", GrantError.NOT_FOUND),
+    (BatchTarget.USER_ROLE, BatchAction.DELETE): (UserRoleCurd, GrantRole, "user:update", GrantError.NOT_FOUND),
+    (BatchTarget.ROLE_PERMISSION, BatchAction.CREATE): (RolePermissionCurd, GrantPermission, "role:update", GrantError.NOT_FOUND),
+    (BatchTarget.ROLE_PERMISSION, BatchAction.DELETE): (RolePermissionCurd, GrantPermission, "role:update", GrantError.NOT_FOUND),
+}
+
+
+def _parse_batch(
+        records: Iterator[tuple[int, dict | None, str | None]],
+        size: int,
+) -> list[tuple[int, dict | None, UserImport | None, str | None]]:
+    parsed = []
+    for line, record, error in itertools.islice(records, size):
+        user = None
+        if error is None:
+            try:
+                user = UserImport.model_validate(record)
+            except ValidationError as e:
+                error = "; ".join(f"{'.'.join(map(str, err['loc'])) or 'row'}: {err['msg']}" for err in e.errors())
+        parsed.append((line, record, user, error))
+    return parsed
 
 
 class AuthService(BaseService):
@@ -21,8 +64,7 @@ class AuthService(BaseService):
             redis: Redis,
     ) -> TokenData:
         user = await UserCurd.authenticate(session, form.username, form.password)
-        access_token = await Token.create(redis, TokenType.ACCESS, user.username, user.scopes)
-        refresh_token = await Token.create(redis, TokenType.REFRESH, user.username, user.scopes)
+        access_token, refresh_token = await Token.create_pair(redis, user.username, user.scopes)
         return TokenData(access_token=access_token, refresh_token=refresh_token)
 
     @staticmethod
@@ -39,14 +81,83 @@ class AuthService(BaseService):
             session: AsyncSession,
             redis: Redis,
     ):
-        user: User = await UserCurd.select(session, UserSelect(username=body.username))
+        user: User = await UserCurd.select(session, UserSelect(username=body.username), options=UserCurd.load())
         await Token.clear(redis, user.username)
 
+    @staticmethod
+    async def introspect(
+            body: IntrospectRequestBody,
+            session: AsyncSession,
+            redis: Redis,
+    ) -> IntrospectResponse:
+        payloads = await Token.verify_many(redis, TokenType.ACCESS, body.tokens)
+        subjects = {payload["sub"] for payload in payloads if payload}
+        version = await Scope.version(redis)
+        scopes = await Scope.get_many(redis, subjects, version)
+        if missing := subjects - scopes.keys():
+            found = await UserCurd.scopes_many(session, missing)
+            scopes |= await Scope.set_many(redis, found, version, fill_ttl(session, settings.SCOPE_CACHE_TTL))
+        result = IntrospectResponse()
+        for payload in payloads:
+            user_scopes = scopes.get(payload["sub"]) if payload else None
+            # a deleted user or a token whose scopes were changed since issue is no longer active
+            if user_scopes is None or set(payload["scopes"]) != user_scopes:
+                result.results.append(TokenIntrospection())
+                continue
+            result.results.append(TokenIntrospection(
+                active=True,
+                sub=payload["sub"],
+                scopes=sorted(user_scopes),
+                exp=payload["exp"],
+            ))
+        return result
+
     @classmethod
+    @cached(tags=["user"])
     async def select_user(cls, session: AsyncSession, user_in: UserSelect) -> UserPublic:
-        user = await UserCurd.select(session, user_in)
+        user = await UserCurd.select(session, user_in, options=UserCurd.load("roles.permissions"), coalesce=True)
         return UserPublic.model_validate(user)
 
+    @staticmethod
+    async def list_users(session: AsyncSession, user_in: UserList) -> UserPage:
+        users, next_cursor = await UserCurd.page(session, user_in)
+        return UserPage(
+            items=[UserPublic.model_validate(user, update={"roles": None}) for user in users],
+            next_cursor=next_cursor,
+        )
+
+    @staticmethod
+    async def export_users(session_maker: async_sessionmaker[AsyncSession]) -> AsyncIterator[bytes]:
+        async for users in UserCurd.export(session_maker, settings.EXPORT_CHUNK_SIZE):
+            yield "".join(json.dumps(user, separators=(",", ":")) + "\n" for user in users).encode()
+
+    @staticmethod
+    async def import_users(
+            session: AsyncSession,
+            lines: Iterable[str],
+            fmt: Literal["csv", "ndjson"],
+            upsert: bool = False,
+    ) -> UserImportResult:
+        result = UserImportResult()
+        roles: dict[str, int] = {}
+        records = parse_records(lines, fmt)
+        # reading, decoding and validating the upload is blocking work, done a batch at a time off the event loop
+        while parsed := await asyncio.to_thread(_parse_batch, records, settings.IMPORT_BATCH_SIZE):
+            batch: list[tuple[int, UserImport]] = []
+            for line, record, user, error in parsed:
+                result.total += 1
+                if error is not None:
+                    result.fail(line, record.get("username") if record else None, error)
+                else:
+                    batch.append((line, user))
+            if batch:
+                await UserCurd.bulk_import(session, batch, roles, upsert, result)
+        if result.created or result.updated:
+            await UserCurd.after_write(session)
+        if result.updated:
+            await Scope.invalidate(session)
+        return result
+
     @staticmethod
     async def create_user(session: AsyncSession, user_in: UserCreate) -> UserPublic:
         user = await UserCurd.create(session, user_in)
@@ -55,17 +166,92 @@ class AuthService(BaseService):
     @staticmethod
     async def update_user(session: AsyncSession, user_in: UserUpdate) -> UserPublic:
         user = await UserCurd.update(session, user_in)
-        return UserPublic.model_validate(user)
+        return UserPublic.model_validate(user, update={"roles": None})
 
     @staticmethod
     async def delete_user(session: AsyncSession, user_in: UserDelete):
         await UserCurd.delete(session, user_in)
 
+    @staticmethod
+    async def batch(session: AsyncSession, body: BatchRequestBody, scopes: frozenset[str]) -> BatchResponse:
+        results = [BatchResult(index=index) for index in range(len(body.operations))]
+
+        def fail(index: int, status_code: int, detail: str) -> None:
+            results[index].status_code = status_code
+            results[index].detail = detail
+
+        groups: list[tuple[tuple[BatchTarget, BatchAction], list[tuple[int, SQLModel]]]] = []
+        for index, operation in enumerate(body.operations):
+            key = (operation.target, operation.action)
+            if key not in _BATCH:
+                fail(index, status.HTTP_422_UNPROCESSABLE_ENTITY, Error.INVALID_ARGS)
+                continue
+            _, schema, scope, _ = _BATCH[key]
+            if settings.ADMIN_PERMISSION_SCOPE not in scopes and scope not in scopes:
+                fail(index, status.HTTP_403_FORBIDDEN, AuthError.INVALID_SCOPES)
+                continue
+            try:
+                model_in = schema.model_validate(operation.data)
+            except ValidationError as e:
+                fail(index, status.HTTP_422_UNPROCESSABLE_ENTITY, "; ".join(
+                    f"{'.'.join(map(str, err['loc'])) or 'data'}: {err['msg']}" for err in e.errors()
+                ))
+                continue
+            if groups and groups[-1][0] == key:
+                groups[-1][1].append((index, model_in))
+            else:
+                groups.append((key, [(index, model_in)]))
+
+        for key, items in groups:
+            curd, _, _, not_found = _BATCH[key]
+            if key[1] != BatchAction.CREATE:
+                found = await curd.exists_many(session, [model_in for _, model_in in items])
+                for index, model_in in items:
+                    if curd.identity(model_in) not in found:
+                        fail(index, status.HTTP_404_NOT_FOUND, not_found)
+        if any(result.status_code != status.HTTP_200_OK for result in results):
+            await session.rollback()
+            return BatchResponse(committed=False, results=results)
+
+        try:
+            for (target, action), items in groups:
+                curd = _BATCH[(target, action)][0]
+                models_in = [model_in for _, model_in in items]
+                if action == BatchAction.CREATE:
+                    models_in = await curd.create_many(session, models_in)
+                elif action == BatchAction.UPDATE:
+                    await curd.update_many(session, models_in)
+                else:
+                    await curd.delete_many(session, models_in)
+                for (index, _), model in zip(items, models_in):
+                    results[index].data = dict(zip((column.name for column in curd.primary_key()), curd.identity(model)))
+            await session.commit()
+        except Exception as e:
+            await session.rollback()
+            for result in results:
+                fail(result.index, status.HTTP_500_INTERNAL_SERVER_ERROR, str(e) or Error.FAILURE)
+            return BatchResponse(committed=False, results=results)
+
+        for curd in {_BATCH[key][0] for key, _ in groups}:
+            await curd.after_write(session)
+        if any(target == BatchTarget.USER and action != BatchAction.CREATE for (target, action), _ in groups):
+            await Scope.invalidate(session)
+        return BatchResponse(committed=True, results=results)
+
     @classmethod
+    @cached(tags=["role"])
     async def select_role(cls, session: AsyncSession, role_in: RoleSelect) -> RolePublic:
-        role = await RoleCurd.select(session, role_in)
+        role = await RoleCurd.select(session, role_in, options=RoleCurd.load("permissions"), coalesce=True)
         return RolePublic.model_validate(role)
 
+    @staticmethod
+    async def list_roles(session: AsyncSession, role_in: RoleList) -> RolePage:
+        roles, next_cursor = await RoleCurd.page(session, role_in)
+        return RolePage(
+            items=[RolePublic.model_validate(role, update={"permissions": None}) for role in roles],
+            next_cursor=next_cursor,
+        )
+
     @staticmethod
     async def create_role(session: AsyncSession, role_in: RoleCreate) -> RolePublic:
         role = await RoleCurd.create(session, role_in)
@@ -74,17 +260,26 @@ class AuthService(BaseService):
     @staticmethod
     async def update_role(session: AsyncSession, role_in: RoleUpdate) -> RolePublic:
         role = await RoleCurd.update(session, role_in)
-        return RolePublic.model_validate(role)
+        return RolePublic.model_validate(role, update={"permissions": None})
 
     @staticmethod
     async def delete_role(session: AsyncSession, role_in: RoleDelete):
         await RoleCurd.delete(session, role_in)
 
     @classmethod
+    @cached(tags=["permission"])
     async def select_permission(cls, session: AsyncSession, permission_in: PermissionSelect) -> PermissionPublic:
-        permission = await PermissionCurd.select(session, permission_in)
+        permission = await PermissionCurd.select(session, permission_in, options=PermissionCurd.load(), coalesce=True)
         return PermissionPublic.model_validate(permission)
 
+    @staticmethod
+    async def list_permissions(session: AsyncSession, permission_in: PermissionList) -> PermissionPage:
+        permissions, next_cursor = await PermissionCurd.page(session, permission_in)
+        return PermissionPage(
+            items=[PermissionPublic.model_validate(permission) for permission in permissions],
+            next_cursor=next_cursor,
+        )
+
     @staticmethod
     async def create_permission(session: AsyncSession, permission_in: PermissionCreate) -> PermissionPublic:
         permission = await PermissionCurd.create(session, permission_in)
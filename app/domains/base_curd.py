@@ -1,34 +1,206 @@
-from typing import TypeVar, Type, Generic, Sequence
+from typing import TypeVar, Type, Generic, Sequence, Literal
 
+from sqlalchemy import inspect, tuple_, Column, ColumnElement
+from sqlalchemy import insert as insert_stmt, update as update_stmt, delete as delete_stmt
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload, noload, raiseload, load_only
+from sqlalchemy.sql.base import ExecutableOption
 from sqlmodel import SQLModel, select
 
+from app.decorators.cache import invalidate_tags
+from app.decorators.singleflight import SingleFlight
 from app.domains.base_exception import Error
-from app.domains.base_schema import BaseSelect
+from app.domains.base_schema import BaseSelect, BaseList
+from app.utils.parse import dump_cursor, parse_cursor
 
 M = TypeVar("M")
 
+select_flight = SingleFlight()
+
+Lazy = Literal["noload", "raise"]
+
+
+class LoadOptions(list[ExecutableOption]):
+    # loader options are rebuilt per call, so the arguments of Curd.load describe them for coalescing
+    def __init__(self, options: list[ExecutableOption], key: tuple):
+        super().__init__(options)
+        self.key = key
+
+
+def _depth_tree(model: type, depth: int) -> dict:
+    if depth <= 0:
+        return {}
+    return {
+        relationship.key: _depth_tree(relationship.mapper.class_, depth - 1)
+        for relationship in inspect(model).relationships
+    }
+
+
+def _merge_path(tree: dict, path: str) -> None:
+    for name in path.split("."):
+        tree = tree.setdefault(name, {})
+
+
+def _load_options(
+        model: type,
+        tree: dict,
+        lazy: Lazy,
+        columns: dict[str, Sequence[str]],
+        path: str = "",
+) -> list[ExecutableOption]:
+    relationships = inspect(model).relationships
+    if unknown := tree.keys() - relationships.keys():
+        raise Exception(f"{Error.INVALID_ARGS}: {', '.join(sorted(unknown))}")
+    options: list[ExecutableOption] = []
+    if path in columns:
+        options.append(load_only(*(getattr(model, column) for column in columns[path])))
+    for relationship in relationships:
+        attr = getattr(model, relationship.key)
+        if relationship.key in tree:
+            sub_path = f"{path}.{relationship.key}" if path else relationship.key
+            sub_options = _load_options(relationship.mapper.class_, tree[relationship.key], lazy, columns, sub_path)
+            options.append(selectinload(attr).options(*sub_options))
+        elif lazy == "raise":
+            options.append(raiseload(attr))
+        else:
+            options.append(noload(attr))
+    return options
+
 
 class Curd(Generic[M]):
     model: Type[M]
+    # natural key used to recover auto-increment ids after a multi-row insert
+    unique: str | None = None
+    # @cached tags whose entries embed rows of this model
+    tags: tuple[str, ...] = ()
+
+    @classmethod
+    async def after_write(cls, session: AsyncSession) -> None:
+        await invalidate_tags(session, *cls.tags)
+
+    @classmethod
+    def load(
+            cls,
+            *paths: str,
+            depth: int = 0,
+            lazy: Lazy = "noload",
+            columns: dict[str, Sequence[str]] | None = None,
+    ) -> LoadOptions:
+        tree = _depth_tree(cls.model, depth)
+        for path in paths:
+            _merge_path(tree, path)
+        key = (
+            tuple(sorted(paths)),
+            depth,
+            lazy,
+            tuple(sorted((path, tuple(names)) for path, names in (columns or {}).items())),
+        )
+        return LoadOptions(_load_options(cls.model, tree, lazy, columns or {}), key)
 
     @classmethod
-    async def select(cls, session: AsyncSession, model_in: "SQLModel", one: bool = True) -> M | Sequence[M]:
+    async def select(
+            cls,
+            session: AsyncSession,
+            model_in: "SQLModel",
+            one: bool = True,
+            options: Sequence[ExecutableOption] | None = None,
+            coalesce: bool = False,
+    ) -> M | Sequence[M]:
         model_in = model_in.model_dump(exclude_unset=True, exclude_defaults=True)
         if not model_in:
             raise Exception(Error.INVALID_ARGS)
         conditions = [getattr(cls.model, field) == value for field, value in model_in.items()]
         stmt = select(cls.model).where(*conditions)
+        if options:
+            stmt = stmt.options(*options)
+
+        async def _execute():
+            result = await session.execute(stmt)
+            result = result.scalars()
+            return result.one_or_none() if one else result.all()
+
+        session_maker = session.info.get("auth_session_maker")
+        # a session inside a transaction may read its own uncommitted writes, which a shared query cannot see,
+        # and options not built by Curd.load have no description to compare, so neither is ever shared
+        if (
+                not coalesce
+                or session_maker is None
+                or session.in_transaction()
+                or (options and not isinstance(options, LoadOptions))
+        ):
+            return await _execute()
+
+        async def _execute_shared():
+            # the shared query must outlive any one caller, so it runs on a session none of them owns
+            async with session_maker() as shared_session:
+                result = await shared_session.execute(stmt)
+                result = result.scalars()
+                models = result.one_or_none() if one else result.all()
+                return models, bool(shared_session.info.get("auth_replica_read"))
+
+        key = (
+            cls.model,
+            tuple(sorted(model_in.items())),
+            one,
+            options.key if options else (),
+        )
+        (models, replica_read), _ = await select_flight.do(key, _execute_shared)
+        if replica_read:
+            session.info["auth_replica_read"] = True
+        # the detached rows are copied into every caller's session without another query
+        if one:
+            return None if models is None else await session.merge(models, load=False)
+        return [await session.merge(model, load=False) for model in models]
+
+    @classmethod
+    async def page(
+            cls,
+            session: AsyncSession,
+            model_in: BaseList,
+            options: Sequence[ExecutableOption] | None = None,
+    ) -> tuple[Sequence[M], str | None]:
+        filters = model_in.model_dump(exclude_unset=True, exclude_defaults=True, exclude={"cursor", "limit"})
+        conditions = [getattr(cls.model, field).startswith(value, autoescape=True) for field, value in filters.items()]
+        if model_in.cursor:
+            try:
+                after = int(parse_cursor(model_in.cursor)["id"])
+            except Exception:
+                raise Exception(Error.INVALID_CURSOR)
+            conditions.append(cls.model.id > after)
+        stmt = (
+            select(cls.model)
+            .where(*conditions)
+            .order_by(cls.model.id)
+            .limit(model_in.limit + 1)
+            .options(*(cls.load() if options is None else options))
+        )
         result = await session.execute(stmt)
-        result = result.scalars()
-        return result.one_or_none() if one else result.all()
+        models = result.scalars().all()
+        if len(models) <= model_in.limit:
+            return models, None
+        models = models[:model_in.limit]
+        return models, dump_cursor({"id": models[-1].id})
 
     @classmethod
-    async def create(cls, session: AsyncSession, model_in: "SQLModel", update: dict | None = None) -> M:
+    async def create(
+            cls,
+            session: AsyncSession,
+            model_in: "SQLModel",
+            update: dict | None = None,
+            options: Sequence[ExecutableOption] | None = None,
+    ) -> M:
         try:
             model = cls.model.model_validate(model_in, update=update)
-            session.add(model)
+            columns = cls.primary_key()
+            generated = {column.name for column in columns if getattr(model, column.name) is None}
+            result = await session.execute(
+                insert_stmt(cls.model.__table__).values(**model.model_dump(exclude=generated))
+            )
+            for column, value in zip(columns, result.inserted_primary_key):
+                setattr(model, column.name, value)
+            if options is not None:
+                model = await cls.select(session, BaseSelect(id=model.id), options=options)
         except IntegrityError as exc:
             await session.rollback()
             raise Exception(exc.args[0])
@@ -36,14 +208,24 @@ class Curd(Generic[M]):
             await session.rollback()
             raise
         await session.commit()
-        await session.refresh(model)
+        await cls.after_write(session)
         return model
 
     @classmethod
-    async def update(cls, session: AsyncSession, model_in: "SQLModel", update: dict | None = None) -> M:
+    async def update(
+            cls,
+            session: AsyncSession,
+            model_in: "SQLModel",
+            update: dict | None = None,
+            options: Sequence[ExecutableOption] | None = None,
+    ) -> M:
         try:
-            model = await cls.select(session, BaseSelect(id=model_in.id))
-            model.sqlmodel_update(model_in.model_dump(exclude_unset=True, exclude_defaults=True), update=update)
+            values = model_in.model_dump(exclude_unset=True, exclude_defaults=True, exclude={"id"}) | (update or {})
+            if values:
+                await session.execute(update_stmt(cls.model).where(cls.model.id == model_in.id).values(**values))
+            model = await cls.select(session, BaseSelect(id=model_in.id), options=cls.load() if options is None else options)
+            if not model:
+                raise Exception(Error.NOT_FOUND)
         except IntegrityError as exc:
             await session.rollback()
             raise Exception(exc.args[0])
@@ -51,13 +233,13 @@ class Curd(Generic[M]):
             await session.rollback()
             raise
         await session.commit()
-        await session.refresh(model)
+        await cls.after_write(session)
         return model
 
     @classmethod
     async def delete(cls, session: AsyncSession, model_in: "SQLModel") -> None:
         try:
-            model = await cls.select(session, BaseSelect(id=model_in.id))
+            model = await cls.select(session, BaseSelect(id=model_in.id), options=cls.load(depth=1))
             await session.delete(model)
         except IntegrityError as exc:
             await session.rollback()
@@ -66,3 +248,78 @@ class Curd(Generic[M]):
             await session.rollback()
             raise
         await session.commit()
+        await cls.after_write(session)
+
+    @classmethod
+    def primary_key(cls) -> tuple[Column, ...]:
+        return tuple(inspect(cls.model).primary_key)
+
+    @classmethod
+    def identity(cls, model_in: "SQLModel") -> tuple:
+        return tuple(getattr(model_in, column.name) for column in cls.primary_key())
+
+    @classmethod
+    def _in_identities(cls, identities: Sequence[tuple]) -> ColumnElement[bool]:
+        columns = cls.primary_key()
+        if len(columns) == 1:
+            return columns[0].in_([identity[0] for identity in identities])
+        return tuple_(*columns).in_(identities)
+
+    @classmethod
+    async def exists_many(cls, session: AsyncSession, models_in: Sequence["SQLModel"]) -> set[tuple]:
+        identities = [cls.identity(model_in) for model_in in models_in]
+        result = await session.execute(select(*cls.primary_key()).where(cls._in_identities(identities)))
+        return {tuple(row) for row in result}
+
+    @classmethod
+    async def create_many(
+            cls,
+            session: AsyncSession,
+            models_in: Sequence["SQLModel"],
+            updates: Sequence[dict | None] | None = None,
+    ) -> list[M]:
+        updates = updates or [None] * len(models_in)
+        models = [cls.model.model_validate(model_in, update=update) for model_in, update in zip(models_in, updates)]
+        generated = {column.name for column in cls.primary_key() if getattr(models[0], column.name) is None}
+        await session.execute(
+            insert_stmt(cls.model.__table__).values([model.model_dump(exclude=generated) for model in models])
+        )
+        if generated and cls.unique:
+            column = getattr(cls.model, cls.unique)
+            result = await session.execute(
+                select(column, cls.model.id).where(column.in_([getattr(model, cls.unique) for model in models]))
+            )
+            ids = dict(result.all())
+            for model in models:
+                model.id = ids.get(getattr(model, cls.unique))
+        return models
+
+    @classmethod
+    async def update_many(
+            cls,
+            session: AsyncSession,
+            models_in: Sequence["SQLModel"],
+            updates: Sequence[dict | None] | None = None,
+    ) -> None:
+        updates = updates or [None] * len(models_in)
+        names = {column.name for column in cls.primary_key()}
+        values = []
+        for model_in, update in zip(models_in, updates):
+            value = model_in.model_dump(exclude_unset=True, exclude_defaults=True) | (update or {})
+            value.update((name, getattr(model_in, name)) for name in names)
+            if value.keys() - names:
+                values.append(value)
+        if values:
+            await session.execute(update_stmt(cls.model), values)
+
+    @classmethod
+    async def delete_many(cls, session: AsyncSession, models_in: Sequence["SQLModel"]) -> None:
+        identities = [cls.identity(model_in) for model_in in models_in]
+        if len(cls.primary_key()) == 1:
+            ids = [identity[0] for identity in identities]
+            for relationship in inspect(cls.model).relationships:
+                if relationship.secondary is None:
+                    continue
+                for _, column in relationship.synchronize_pairs:
+                    await session.execute(delete_stmt(relationship.secondary).where(column.in_(ids)))
+        await session.execute(delete_stmt(cls.model.__table__).where(cls._in_identities(identities)))
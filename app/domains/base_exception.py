@@ -7,3 +7,7 @@ class Error:
     INVALID_MYSQL = "Invalid MySQL"
 
     INVALID_ARGS = "Invalid Arguments"
+    INVALID_CURSOR = "Invalid Cursor"
+    NOT_FOUND = "Not Found"
+
+    BUSY_PASSWORD_HASHER = "Password hasher is busy"
@@ -1,8 +1,10 @@
-from typing import Any
+from typing import Generic, TypeVar
 
 from fastapi import status
+from pydantic import BaseModel
 from sqlmodel import SQLModel, Field
 
+from app.core.config import settings
 from app.domains.base_exception import Error
 
 
@@ -14,16 +16,29 @@ class BaseRequest(SQLModel):
     ...
 
 
-class BaseResponse(SQLModel):
+D = TypeVar("D")
+
+
+# a pydantic generic rather than SQLModel, which does not parametrize fields, so routes can declare BaseResponse[UserPublic]
+class BaseResponse(BaseModel, Generic[D]):
     status_code: int = Field(default=status.HTTP_200_OK, description="status code")
     detail: str = Field(default=Error.SUCCESS, description="detail")
-    data: Any | None = Field(default=None, description="data")
+    data: D | None = Field(default=None, description="data")
 
 
 class BaseSelect(SQLModel):
     id: int | None = Field(default=None)
 
 
+class BaseList(SQLModel):
+    cursor: str | None = Field(default=None, description="next_cursor of the previous page")
+    limit: int = Field(default=settings.PAGE_SIZE, ge=1, le=settings.PAGE_SIZE_MAX)
+
+
+class BasePage(BaseData):
+    next_cursor: str | None = Field(default=None)
+
+
 class BaseUpdate(SQLModel):
     id: int
 
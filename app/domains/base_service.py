@@ -3,14 +3,15 @@ import logging
 from typing import Callable, Awaitable, TypeVar, Any
 
 from fastapi import status, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlmodel import SQLModel
 
 from app.core.config import settings
+from app.core.response import FastJSONResponse
 from app.domains.base_exception import Error
 from app.domains.base_schema import BaseData, BaseResponse
 
 D = TypeVar("D", bound=BaseData | SQLModel)
-R = TypeVar("R", bound=BaseResponse)
 
 
 class BaseService:
@@ -27,30 +28,39 @@ class BaseService:
             func: Callable[..., Awaitable[D]],
             *args,
             **kwargs,
-    ) -> R:
+    ) -> FastJSONResponse:
         data: Any | None = None
         try:
             data: D = await func(*args, **kwargs)
-            return BaseResponse(
+            return FastJSONResponse(BaseResponse(
                 status_code=status.HTTP_200_OK,
                 detail=Error.SUCCESS,
                 data=data,
-            )
+            ))
         except asyncio.CancelledError:
             raise
         except HTTPException as e:
             if settings.DEBUG:
                 logging.exception(f"{func.__name__} HTTPException: {e.detail}")
-            return BaseResponse(
+            envelope = BaseResponse(
                 status_code=e.status_code,
                 detail=e.detail,
                 data=data,
             )
+            # load shedding has to reach clients and load balancers as a real 503 with its Retry-After
+            if e.status_code == status.HTTP_503_SERVICE_UNAVAILABLE:
+                return FastJSONResponse(envelope, status_code=e.status_code, headers=e.headers)
+            return FastJSONResponse(envelope)
         except Exception as e:
             if settings.DEBUG:
                 logging.exception(f"{func.__name__} error")
-            return BaseResponse(
+            return FastJSONResponse(BaseResponse(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=str(e) or Error.FAILURE,
                 data=data,
-            )
+            ))
+        finally:
+            # hand the pooled connection back before the response is sent
+            for arg in (*args, *kwargs.values()):
+                if isinstance(arg, AsyncSession):
+                    await arg.close()
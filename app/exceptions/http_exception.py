@@ -1,9 +1,10 @@
 from fastapi import Request, Response, HTTPException
-from fastapi.responses import JSONResponse
+
+from app.core.response import FastJSONResponse
 
 
 async def http_exception_handler(request: Request, exc: HTTPException) -> Response:
-    return JSONResponse(
+    return FastJSONResponse(
         content={
             "status_code": exc.status_code,
             "detail": exc.detail,
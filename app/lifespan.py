@@ -1,5 +1,7 @@
+import asyncio
 import logging
 import ssl
+import time
 from contextlib import asynccontextmanager
 from typing import TypedDict, AsyncIterator
 
@@ -9,48 +11,124 @@ from fastapi import FastAPI
 from redis.asyncio import Redis, ConnectionPool
 from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
 
+from app.api.dependencies.auth import resolve_token
 from app.core.config import settings
-from app.core.database.mysql import create_auth_mysql_engine, create_auth_mysql_session_maker, init_auth_mysql
-from app.core.database.redis import create_auth_redis_pool
+from app.core.database.mysql import create_auth_mysql_engine, create_auth_mysql_session_maker, \
+    create_auth_mysql_replica_engines, prewarm_auth_mysql, bootstrap_auth_mysql
+from app.core.database.redis import create_auth_redis_pool, load_scripts, ClientCache, prewarm_auth_redis
+from app.core.jwk import KeySet
+from app.core.metrics import Metrics
+from app.core.password import Password
+from app.core.scope import Scope
+from app.core.timing import trace_config
+from app.core.token import RevokedTokens, TokenCache
+from app.decorators.cache import TAG_PREFIX
+from app.domains.auth.const import RedisKey
+from app.domains.base_curd import select_flight
 
 
 class LifespanState(TypedDict, total=False):
     aiohttp_session: ClientSession
     auth_redis_pool: ConnectionPool
     auth_mysql_engine: AsyncEngine
+    auth_mysql_replica_engines: list[AsyncEngine]
     auth_mysql_session_maker: async_sessionmaker[AsyncSession]
 
 
+def _elapsed(started: float) -> str:
+    return f"{(time.perf_counter() - started) * 1000:.1f}ms"
+
+
+async def init_auth_redis(auth_redis_pool: ConnectionPool) -> None:
+    started = time.perf_counter()
+    auth_redis = Redis.from_pool(auth_redis_pool)
+    await asyncio.gather(load_scripts(auth_redis), prewarm_auth_redis(auth_redis_pool))
+    # every mode listens, revocations made in another worker must evict this worker's TokenCache
+    RevokedTokens.start(auth_redis_pool)
+    if settings.REDIS_CLIENT_CACHE:
+        ClientCache.start(auth_redis_pool, [*RedisKey.TRACKING_PREFIXES(), TAG_PREFIX])
+    logging.warning(f"Initialized redis in {_elapsed(started)}.")
+
+
+async def init_auth_mysql_engines(
+        auth_mysql_engine: AsyncEngine,
+        auth_mysql_replica_engines: list[AsyncEngine],
+        auth_mysql_session_maker: async_sessionmaker[AsyncSession],
+) -> None:
+    started = time.perf_counter()
+    prewarm = asyncio.gather(*(
+        prewarm_auth_mysql(engine) for engine in (auth_mysql_engine, *auth_mysql_replica_engines)
+    ))
+    bootstrapped = False
+    if settings.MYSQL_BOOTSTRAP:
+        _, bootstrapped = await asyncio.gather(prewarm, bootstrap_auth_mysql(auth_mysql_engine, auth_mysql_session_maker))
+    else:
+        await prewarm
+    logging.warning(f"Initialized mysql in {_elapsed(started)}{', bootstrapped schema' if bootstrapped else ''}.")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncIterator[LifespanState]:
+    started = time.perf_counter()
+
     # init aiohttp session
     ssl_context = ssl.create_default_context(cafile=certifi.where())
     aiohttp_session = ClientSession(
         timeout=ClientTimeout(total=settings.AIOHTTP_TIMEOUT),
         connector=TCPConnector(ssl=ssl_context),
+        trace_configs=[trace_config()],
     )
-    logging.warning("Initialized aiohttp session.")
 
-    # init redis
-    auth_redis_pool = await create_auth_redis_pool()
-    auth_redis = Redis.from_pool(auth_redis_pool)
-    await auth_redis.ping()
-    logging.warning("Initialized redis.")
+    # init jwt keys
+    KeySet.load()
 
-    # init mysql
+    # pools and engines connect lazily, redis and mysql are then warmed up concurrently
+    auth_redis_pool = await create_auth_redis_pool()
     auth_mysql_engine = await create_auth_mysql_engine()
-    auth_mysql_session_maker = await create_auth_mysql_session_maker(auth_mysql_engine)
-    async with auth_mysql_session_maker() as session:
-        await init_auth_mysql(session)
-    logging.warning("Initialized mysql.")
+    auth_mysql_replica_engines = await create_auth_mysql_replica_engines()
+    auth_mysql_session_maker = await create_auth_mysql_session_maker(
+        auth_mysql_engine,
+        auth_redis_pool,
+        auth_mysql_replica_engines,
+    )
+    await asyncio.gather(
+        init_auth_redis(auth_redis_pool),
+        init_auth_mysql_engines(auth_mysql_engine, auth_mysql_replica_engines, auth_mysql_session_maker),
+    )
+    if settings.METRICS_ENABLED:
+        Metrics.start(
+            engines={
+                "primary": auth_mysql_engine,
+                **{f"replica-{i}": engine for i, engine in enumerate(auth_mysql_replica_engines)},
+            },
+            redis_pool=auth_redis_pool,
+            connector=aiohttp_session.connector,
+            components={
+                "token_cache": TokenCache.stats,
+                "revoked_tokens": RevokedTokens.stats,
+                "scope_cache": Scope.stats,
+                "client_cache": ClientCache.stats,
+                "password": Password.stats,
+                "select_flight": select_flight.stats,
+                "token_flight": resolve_token.group.stats,
+            },
+        )
+    logging.warning(f"Ready in {_elapsed(started)}.")
 
     yield LifespanState(
         aiohttp_session=aiohttp_session,
         auth_redis_pool=auth_redis_pool,
         auth_mysql_engine=auth_mysql_engine,
+        auth_mysql_replica_engines=auth_mysql_replica_engines,
         auth_mysql_session_maker=auth_mysql_session_maker,
     )
 
+    await Metrics.stop()
+    await RevokedTokens.stop()
+    await ClientCache.stop()
     await auth_mysql_engine.dispose()
+    for replica_engine in auth_mysql_replica_engines:
+        await replica_engine.dispose()
     await auth_redis_pool.aclose()
     await aiohttp_session.close()
+    Password.shutdown()
@@ -2,9 +2,13 @@ from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.api import api_router
+from app.api.routes import well_known, metrics
 from app.core.config import settings
+from app.core.response import FastJSONResponse
 from app.exceptions.http_exception import http_exception_handler
 from app.lifespan import lifespan
+from app.middlewares.metrics import MetricsMiddleware
+from app.middlewares.timing import ServerTimingMiddleware
 
 app = FastAPI(
     debug=settings.DEBUG,
@@ -15,6 +19,7 @@ app = FastAPI(
     redoc_url=f"{settings.API_PREFIX}/redoc",
     swagger_ui_oauth2_redirect_url=f"{settings.API_PREFIX}/docs/oauth2-redirect",
     lifespan=lifespan,
+    default_response_class=FastJSONResponse,
 )
 
 app.add_middleware(
@@ -25,6 +30,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if settings.SERVER_TIMING_SAMPLE_RATE > 0:
+    app.add_middleware(ServerTimingMiddleware)
+
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 app.add_exception_handler(HTTPException, http_exception_handler)  # type: ignore
 
 app.include_router(api_router, prefix=settings.API_PREFIX)
+app.include_router(well_known.router)
+if settings.METRICS_ENABLED:
+    app.include_router(metrics.router)
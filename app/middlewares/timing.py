@@ -0,0 +1,67 @@
+import json
+import logging
+import random
+import time
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Scope, Receive, Send, Message
+
+from app.core.config import settings
+from app.core.timing import start_timing, stop_timing
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings.SERVER_TIMING_LOG_LEVEL)
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    # the line is already structured, the root handlers would print it a second time with their own prefix
+    logger.propagate = False
+
+
+def _server_timing(phases: dict[str, list], total: float) -> str:
+    metrics = [f'{phase};dur={seconds * 1000:.2f};desc="{calls}x"' for phase, (seconds, calls) in phases.items()]
+    metrics.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(metrics)
+
+
+class ServerTimingMiddleware:
+    # only a sampled share of requests pays for collecting phases, the rest pass straight through
+
+    def __init__(self, app: ASGIApp, sample_rate: float = settings.SERVER_TIMING_SAMPLE_RATE):
+        self.app = app
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or random.random() >= self.sample_rate:
+            await self.app(scope, receive, send)
+            return
+
+        phases, token = start_timing()
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if settings.SERVER_TIMING_HEADER:
+                    headers = MutableHeaders(scope=message)
+                    headers.append("Server-Timing", _server_timing(phases, time.perf_counter() - started))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            stop_timing(token)
+            logger.info(json.dumps({
+                "event": "server_timing",
+                "method": scope["method"],
+                "route": getattr(scope.get("route"), "path", scope["path"]),
+                "status_code": status_code,
+                "total_ms": round((time.perf_counter() - started) * 1000, 2),
+                "phases": {
+                    phase: {"ms": round(seconds * 1000, 2), "calls": calls}
+                    for phase, (seconds, calls) in phases.items()
+                },
+            }, separators=(",", ":")))
@@ -0,0 +1,31 @@
+import argparse
+import asyncio
+import time
+
+from app.core.database.mysql import create_auth_mysql_engine, create_auth_mysql_session_maker, bootstrap_auth_mysql
+from app.core.database.redis import create_auth_redis_pool
+
+
+async def bootstrap(force: bool) -> None:
+    started = time.perf_counter()
+    engine = await create_auth_mysql_engine()
+    auth_redis_pool = await create_auth_redis_pool()
+    try:
+        session_maker = await create_auth_mysql_session_maker(engine, auth_redis_pool)
+        bootstrapped = await bootstrap_auth_mysql(engine, session_maker, force)
+    finally:
+        await engine.dispose()
+        await auth_redis_pool.aclose()
+    elapsed = (time.perf_counter() - started) * 1000
+    print(f"{'Bootstrapped' if bootstrapped else 'Schema is up to date, skipped'} in {elapsed:.1f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create the auth schema and seed the admin once, outside the workers.")
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="run even when the stored schema fingerprint matches",
+    )
+    args = parser.parse_args()
+    asyncio.run(bootstrap(args.force))
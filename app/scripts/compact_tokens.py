@@ -0,0 +1,94 @@
+import argparse
+import asyncio
+import time
+
+from redis.asyncio import Redis
+
+from app.core.database.redis import create_auth_redis_pool
+from app.domains.auth.const import TokenType, RedisKey
+from app.utils.parse import parse_bytes_to_str
+
+
+async def _live(redis: Redis, token_type: TokenType, jtis: list[str]) -> dict[str, int]:
+    async with redis.pipeline(transaction=False) as pipeline:
+        for jti in jtis:
+            pipeline.pexpiretime(RedisKey.ALLOW(token_type, jti))
+        expires = await pipeline.execute()
+    # a missing allow key reports -2, the jti has already expired or been revoked
+    return {jti: expire // 1000 for jti, expire in zip(jtis, expires) if expire > 0}
+
+
+async def compact_legacy(redis: Redis, token_type: TokenType, migrate: bool, purge: bool, stats: dict[str, int]) -> None:
+    async for token_key in redis.scan_iter(match=RedisKey.TOKEN(token_type, "*"), count=1000):
+        token_key = parse_bytes_to_str(token_key)
+        subject = token_key.removeprefix(RedisKey.TOKEN(token_type, ""))
+        jtis = [parse_bytes_to_str(jti) for jti in await redis.smembers(token_key)]
+        live = await _live(redis, token_type, jtis)
+        stats["pruned"] += len(jtis) - len(live)
+        async with redis.pipeline() as pipeline:
+            # the copy is repeated on purge to pick up tokens issued between --migrate and the TOKEN_STORE switch
+            if (migrate or purge) and live:
+                tokens_key = RedisKey.TOKENS(token_type, subject)
+                pipeline.zadd(tokens_key, live)
+                pipeline.expireat(tokens_key, max(live.values()), gt=True)
+                pipeline.expireat(tokens_key, max(live.values()), nx=True)
+                stats["migrated"] += len(live)
+            if purge:
+                for jti in jtis:
+                    pipeline.delete(RedisKey.ALLOW(token_type, jti))
+                pipeline.delete(token_key)
+                stats["purged"] += len(jtis)
+            elif dead := set(jtis) - live.keys():
+                pipeline.srem(token_key, *dead)
+            await pipeline.execute()
+        stats["subjects"] += 1
+
+
+async def compact_zset(redis: Redis, token_type: TokenType, revoked: set[str], stats: dict[str, int]) -> None:
+    now = int(time.time())
+    async for tokens_key in redis.scan_iter(match=RedisKey.TOKENS(token_type, "*"), count=1000):
+        stats["pruned"] += await redis.zremrangebyscore(tokens_key, "-inf", now)
+        # a migrated copy outlives a revocation made through the key store before the switch
+        if revoked and (stale := revoked.intersection(map(parse_bytes_to_str, await redis.zrange(tokens_key, 0, -1)))):
+            stats["pruned"] += await redis.zrem(tokens_key, *stale)
+        stats["subjects"] += 1
+
+
+async def compact(migrate: bool, purge: bool) -> None:
+    auth_redis_pool = await create_auth_redis_pool()
+    stats = {"subjects": 0, "pruned": 0, "migrated": 0, "purged": 0}
+    try:
+        redis = Redis.from_pool(auth_redis_pool)
+        revoked = set()
+        if purge:
+            revoked = {
+                parse_bytes_to_str(jti)
+                for jti in await redis.zrangebyscore(RedisKey.REVOKED(), int(time.time()), "+inf")
+            }
+        for token_type in (TokenType.ACCESS, TokenType.REFRESH):
+            await compact_legacy(redis, token_type, migrate, purge, stats)
+            await compact_zset(redis, token_type, revoked, stats)
+    finally:
+        await auth_redis_pool.aclose()
+    print(f"Compacted {stats['subjects']} token sets, "
+          f"pruned {stats['pruned']} expired tokens, migrated {stats['migrated']} live tokens, "
+          f"purged {stats['purged']} legacy tokens")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prune expired tokens and optionally migrate to the zset token store.")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--migrate",
+        action="store_true",
+        help="copy live tokens from per-jti keys into per-subject sorted sets, run before setting TOKEN_STORE=zset, "
+             "the per-jti keys are kept so workers still on the key store keep working",
+    )
+    mode.add_argument(
+        "--purge-legacy",
+        action="store_true",
+        help="copy any remaining live tokens, then delete the per-jti keys and their sets, "
+             "run only once every worker has been restarted with TOKEN_STORE=zset",
+    )
+    args = parser.parse_args()
+    asyncio.run(compact(args.migrate, args.purge_legacy))
@@ -0,0 +1,24 @@
+import argparse
+import asyncio
+
+from app.core.database.mysql import create_auth_mysql_engine, create_auth_mysql_session_maker
+from app.domains.auth.service import AuthService
+
+
+async def export(output: str) -> None:
+    engine = await create_auth_mysql_engine()
+    try:
+        session_maker = await create_auth_mysql_session_maker(engine)
+        with open(output, "wb") as file:
+            async for chunk in AuthService.export_users(session_maker):
+                file.write(chunk)
+    finally:
+        await engine.dispose()
+    print(f"Exported users to {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export users with their roles and scopes as NDJSON.")
+    parser.add_argument("-o", "--output", default="users.ndjson")
+    args = parser.parse_args()
+    asyncio.run(export(args.output))
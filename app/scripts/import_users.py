@@ -0,0 +1,32 @@
+import argparse
+import asyncio
+
+from app.core.database.mysql import create_auth_mysql_engine, create_auth_mysql_session_maker
+from app.core.database.redis import create_auth_redis_pool
+from app.core.password import Password
+from app.domains.auth.service import AuthService
+
+
+async def load(path: str, fmt: str, upsert: bool) -> None:
+    auth_redis_pool = await create_auth_redis_pool()
+    engine = await create_auth_mysql_engine()
+    try:
+        session_maker = await create_auth_mysql_session_maker(engine, auth_redis_pool)
+        with open(path, encoding="utf-8", newline="") as file:
+            async with session_maker() as session:
+                result = await AuthService.import_users(session, file, fmt, upsert)
+    finally:
+        await engine.dispose()
+        await auth_redis_pool.aclose()
+        Password.shutdown()
+    print(result.model_dump_json(indent=4))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import users from a CSV or NDJSON file.")
+    parser.add_argument("input")
+    parser.add_argument("-f", "--format", choices=["csv", "ndjson"])
+    parser.add_argument("--upsert", action="store_true", help="update password and email of existing users")
+    args = parser.parse_args()
+    fmt = args.format or ("csv" if args.input.lower().endswith(".csv") else "ndjson")
+    asyncio.run(load(args.input, fmt, args.upsert))
@@ -0,0 +1,76 @@
+import gc
+import os
+import shutil
+import time
+
+from gunicorn.app.base import BaseApplication
+from gunicorn.util import import_app
+from uvicorn_worker import UvicornWorker
+
+from app.core.config import settings
+
+
+class Worker(UvicornWorker):
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools", "lifespan": "on"}
+
+
+def when_ready(server) -> None:
+    # objects of the preloaded app are never collected, so the gc does not dirty their shared pages in the workers
+    gc.freeze()
+
+
+def post_fork(server, worker) -> None:
+    # age counts every spawn, only the initial boot is staggered, a respawn joins workers that are already serving
+    if worker.age > settings.SERVER_WORKER_COUNT:
+        return
+    # the worker does not heartbeat while sleeping, so the whole boot is squeezed into a third of the timeout
+    step = min(settings.SERVER_STARTUP_STAGGER, settings.SERVER_TIMEOUT / 3 / settings.SERVER_WORKER_COUNT)
+    time.sleep((worker.age - 1) * step)
+
+
+def child_exit(server, worker) -> None:
+    if settings.METRICS_ENABLED:
+        # imported late, prometheus_client picks its value storage from PROMETHEUS_MULTIPROC_DIR at import time
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+
+
+class Server(BaseApplication):
+    def __init__(self, app_uri: str, options: dict):
+        self.app_uri = app_uri
+        self.options = options
+        super().__init__()
+
+    def load_config(self) -> None:
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return import_app(self.app_uri)
+
+
+def run() -> None:
+    if settings.METRICS_ENABLED:
+        # workers write their metrics here so any of them can serve the aggregate, stale files of a previous run go
+        shutil.rmtree(settings.METRICS_MULTIPROC_DIR, ignore_errors=True)
+        os.makedirs(settings.METRICS_MULTIPROC_DIR)
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = settings.METRICS_MULTIPROC_DIR
+    Server("app.main:app", {
+        "bind": f"{settings.SERVER_HOST}:{settings.SERVER_PORT}",
+        "workers": settings.SERVER_WORKER_COUNT,
+        "worker_class": Worker,
+        "preload_app": settings.SERVER_PRELOAD,
+        "max_requests": settings.SERVER_MAX_REQUESTS,
+        "max_requests_jitter": settings.SERVER_MAX_REQUESTS_JITTER,
+        "timeout": settings.SERVER_TIMEOUT,
+        "graceful_timeout": settings.SERVER_GRACEFUL_TIMEOUT,
+        "keepalive": settings.SERVER_KEEPALIVE,
+        "backlog": settings.SERVER_BACKLOG,
+        "when_ready": when_ready,
+        "post_fork": post_fork,
+        "child_exit": child_exit,
+    }).run()
+
+
+if __name__ == "__main__":
+    run()
@@ -1,4 +1,7 @@
-from typing import Any
+import base64
+import csv
+import json
+from typing import Any, Iterable, Iterator, Literal
 
 from sqlalchemy import Select, Update, Delete, Insert
 from sqlalchemy.dialects import mysql
@@ -15,6 +18,47 @@ def parse_to_list(value: Any, separator: str = ",") -> list[str]:
         raise ValueError(f"Cannot parse value to list: {value}")
 
 
+def parse_bytes_to_str(value: str | bytes) -> str:
+    return value.decode() if isinstance(value, (bytes, bytearray)) else value
+
+
 def parse_stmt_to_str(stmt: Select | Update | Delete | Insert) -> str:
     compiled = stmt.compile(dialect=mysql.dialect(), compile_kwargs={"literal_binds": True})
     return compiled.string
+
+
+def dump_cursor(value: dict) -> str:
+    raw = json.dumps(value, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def parse_cursor(cursor: str) -> dict:
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+    value = json.loads(raw)
+    if not isinstance(value, dict):
+        raise ValueError(f"Cannot parse cursor: {cursor}")
+    return value
+
+
+def parse_records(
+        lines: Iterable[str],
+        fmt: Literal["csv", "ndjson"],
+) -> Iterator[tuple[int, dict | None, str | None]]:
+    if fmt == "csv":
+        reader = csv.DictReader(lines)
+        for record in reader:
+            record = {key: value for key, value in record.items() if key and value not in ("", None)}
+            yield reader.line_num, record, None
+        return
+    for line, value in enumerate(lines, start=1):
+        if not value.strip():
+            continue
+        try:
+            record = json.loads(value)
+        except ValueError as e:
+            yield line, None, str(e)
+            continue
+        if not isinstance(record, dict):
+            yield line, None, f"Cannot parse record: {value.strip()}"
+            continue
+        yield line, record, None